@@ -1,28 +1,28 @@
 import configparser
-from importlib import import_module
 from utils.Observer import Observer
 import sys
 import os
 from utils.Loader import Loader
+from utils.Synchronization import enableLockStats, dumpLockStats
+from utils.Heartbeat import Watchdog
+from utils.Metrics import serveMetrics
 import logging
-import time
+import signal
 
 class KeyMaster(object):
 
 	def __init__(self, config_filename):
 		try:
-			# insert all driver paths
-			for x in os.walk('drivers'):
-				if "__pycache__" not in x[0]:
-					sys.path.insert(0, x[0])
-
 			config = configparser.ConfigParser()
 			config.read(config_filename)
 
-			loader = Loader(config)
+			# threads used to import drivers and run their setup
+			workers = 4
+			if config.has_option('KeyMaster', 'startup_workers'):
+				workers = config.getint('KeyMaster', 'startup_workers')
 
-			for driver in config.items('Drivers'):
-				loader.loadDriver(driver[0], driver[1])
+			loader = Loader(config)
+			loader.loadDrivers(config.items('Drivers'), workers)
 		except Exception as e:
 			print("Exception: %s" % str(e))
 			sys.exit(1)
@@ -31,28 +31,50 @@ class KeyMaster(object):
 
 		logging.info("KeyMaster %s Starting ---" % VERSION)
 
+		# KEYMASTER_LOCK_STATS=1 records lock timings, kill -USR1 logs them
+		if os.environ.get('KEYMASTER_LOCK_STATS', '0') not in ('', '0'):
+			enableLockStats()
+			signal.signal(signal.SIGUSR1, self.dumpLockStats)
+
 		try:	
-			startable = dict()
-			for driver_instance in loader.getDrivers():
-				startable[driver_instance] = driver_instance.setup()
+			# Prometheus text on a localhost port and/or a Unix socket
+			metrics_port = None
+			if config.has_option('KeyMaster', 'metrics_port'):
+				metrics_port = config.getint('KeyMaster', 'metrics_port')
+			metrics_socket = None
+			if config.has_option('KeyMaster', 'metrics_socket'):
+				metrics_socket = config.get('KeyMaster', 'metrics_socket')
+			if metrics_port != None or metrics_socket != None:
+				serveMetrics(metrics_port, metrics_socket)
+
+			startable = loader.setupDrivers(workers)
+
+			for driver_type, driver_instance in loader.drivers.items():
+				logging.debug("Driver %s: import %.3fs, setup %.3fs" % (driver_type,
+					loader.import_times.get(driver_type, 0), loader.setup_times.get(driver_type, 0)))
 
-			for driver_instance in loader.getDrivers():
-				if driver_instance in startable:
+			for driver_type, driver_instance in loader.drivers.items():
+				if startable[driver_type]:
 					driver_instance.start()
 
-			# Watch Dog
+			# Watch Dog, reports only while every driver thread is alive
 			logging.debug("Starting watchdog")
-			while True:
-				self.touch("KeyMaster-watchdog")
-				time.sleep(1)
+			watchdog_mode = 'auto'
+			if config.has_option('KeyMaster', 'watchdog'):
+				watchdog_mode = config.get('KeyMaster', 'watchdog').strip().lower()
+			watchdog_file = "KeyMaster-watchdog"
+			if config.has_option('KeyMaster', 'watchdog_file'):
+				watchdog_file = config.get('KeyMaster', 'watchdog_file')
+			watchdog = Watchdog(watchdog_mode, watchdog_file)
+			watchdog.run()
 
 		except Exception as e:
 			logging.error("Exception: %s" % str(e), exc_info=1)
 			sys.exit(1)
 
-	def touch(self, fname, times=None):
-		with open(fname, 'a'):
-			os.utime(fname, times)
+	def dumpLockStats(self, signum, frame):
+		for line in dumpLockStats():
+			logging.info("Lock %s" % line)
 
 if __name__ == '__main__':
 	VERSION = 1.0
@@ -0,0 +1,239 @@
+# benchmarks/KeyMasterBench.py
+'''End to end benchmarks of KeyMaster on the Test*
+drivers, no hardware or AD server needed.  Results are
+written as JSON so runs can be compared between releases.
+
+    python3 -m benchmarks.KeyMasterBench --output bench.json
+'''
+import configparser
+import argparse
+import platform
+import random
+import json
+import math
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the stack of fake drivers the controller is wired to
+TEST_CONFIG = """
+[Drivers]
+controller = LargeMachineController
+rfid = TestRFID
+auth = TestAuth
+log = Log
+relay = TestRelay
+relay_interface = TestInterface
+currentsense = TestCurrentSense
+light = TestRGBLight
+light_interface = TestInterface
+
+[TestAuth]
+authorized = 1000,1001,1002
+"""
+
+BADGE = "1000"
+
+
+def percentiles(samples):
+    '''count, mean, p50, p90, p99 and max of samples
+    in seconds.'''
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+
+    def rank(fraction):
+        return ordered[max(0, int(math.ceil(fraction * len(ordered))) - 1)]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": rank(0.50),
+        "p90": rank(0.90),
+        "p99": rank(0.99),
+        "max": ordered[-1],
+    }
+
+
+def startStack():
+    '''Load and set up the Test* stack, start the
+    controller.  Returns the loader and startup timings.'''
+    from utils.Loader import Loader
+
+    config = configparser.ConfigParser()
+    config.read_string(TEST_CONFIG)
+
+    start = time.perf_counter()
+    loader = Loader(config)
+    loader.loadDrivers(config.items('Drivers'))
+    loaded = time.perf_counter()
+    startable = loader.setupDrivers()
+    ready = time.perf_counter()
+
+    for driver_type, driver_instance in loader.drivers.items():
+        if startable[driver_type]:
+            # benchmark threads must not keep the process alive
+            driver_instance.daemon = True
+            driver_instance.start()
+
+    return loader, {
+        "load_seconds": loaded - start,
+        "setup_seconds": ready - loaded,
+        "total_seconds": ready - start,
+        "import_seconds": dict(loader.import_times),
+        "driver_setup_seconds": dict(loader.setup_times),
+    }
+
+
+def waitIdle(controller, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while controller.state != controller.STATE_IDLE or controller.queue.qsize():
+        if time.monotonic() > deadline:
+            raise Exception("Controller did not reach idle")
+        time.sleep(0.001)
+
+
+def benchScanToRelay(loader, scans):
+    '''Time from a badge scan to the relay closing,
+    then badge out again before the next scan.'''
+    rfid = loader.getDriver('rfid')
+    relay = loader.getDriver('relay')
+    interface = loader.getDriver('relay_interface')
+    controller = loader.getDriver('controller')
+    waitIdle(controller)
+
+    samples = []
+    for i in range(scans):
+        start = time.perf_counter()
+        rfid.notifyScanObservers(BADGE)
+        if not interface.waitRelay(relay.pin, 1, 5):
+            raise Exception("Relay did not close after scan %d" % i)
+        samples.append(time.perf_counter() - start)
+
+        rfid.notifyScanObservers(BADGE)
+        if not interface.waitRelay(relay.pin, 0, 5):
+            raise Exception("Relay did not open after badge out %d" % i)
+        waitIdle(controller)
+    return percentiles(samples)
+
+
+def benchControllerEvents(loader, events):
+    '''Current sense events pushed through the
+    controller queue while idle.'''
+    from drivers.Controller.LargeMachineController import EVENTS
+
+    controller = loader.getDriver('controller')
+    waitIdle(controller)
+
+    target = EVENTS.value + events
+    start = time.perf_counter()
+    for i in range(events):
+        controller.currentChangeEvent(False)
+    queued = time.perf_counter()
+    while EVENTS.value < target:
+        time.sleep(0.0005)
+    elapsed = time.perf_counter() - start
+    return {
+        "events": events,
+        "seconds": elapsed,
+        "events_per_second": events / elapsed,
+        "queue_seconds": queued - start,
+    }
+
+
+def benchCacheLookup(sizes, lookups):
+    '''ADCacheAuth index build and lookup for caches
+    of each size, nine in ten lookups hit.'''
+    try:
+        from drivers.Auth.ADCacheAuth import ADCacheAuth
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    generator = random.Random(42)
+    results = []
+    for size in sizes:
+        auth = ADCacheAuth({}, None)
+        auth.groups_allowed = frozenset(["members"])
+        auth.groups_denied = frozenset(["suspended"])
+
+        cache = {}
+        for i in range(size):
+            groups = ["members"] if i % 10 else ["members", "suspended"]
+            cache[str(10000000 + i)] = {"user": {"groups": groups}}
+
+        start = time.perf_counter()
+        auth.updateCache(cache)
+        indexed = time.perf_counter() - start
+
+        badges = [str(10000000 + generator.randrange(size)) if generator.random() < 0.9
+                  else str(90000000 + generator.randrange(size)) for i in range(lookups)]
+        lookup = auth.lookup
+        start = time.perf_counter()
+        for badge in badges:
+            lookup(badge)
+        elapsed = time.perf_counter() - start
+
+        results.append({
+            "entries": size,
+            "index_seconds": indexed,
+            "lookups": lookups,
+            "seconds": elapsed,
+            "lookups_per_second": lookups / elapsed,
+        })
+    return results
+
+
+BENCHMARKS = ('startup', 'scan_to_relay', 'controller_events', 'cache_lookup')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="KeyMaster end to end benchmarks")
+    parser.add_argument('--output', help="write JSON here instead of stdout")
+    parser.add_argument('--only', action='append', choices=BENCHMARKS)
+    parser.add_argument('--scans', type=int, default=200)
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--lookups', type=int, default=200000)
+    parser.add_argument('--sizes', default="1000,10000,100000",
+                        help="comma separated ADCacheAuth cache sizes")
+    args = parser.parse_args(argv)
+    only = set(args.only or BENCHMARKS)
+
+    # drivers are found relative to the repository root
+    os.chdir(ROOT)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    results = {}
+    if only & {'startup', 'scan_to_relay', 'controller_events'}:
+        # first so that startup includes the cold imports
+        loader, startup = startStack()
+        if 'startup' in only:
+            results['startup'] = startup
+        if 'scan_to_relay' in only:
+            results['scan_to_relay'] = benchScanToRelay(loader, args.scans)
+        if 'controller_events' in only:
+            results['controller_events'] = benchControllerEvents(loader, args.events)
+    if 'cache_lookup' in only:
+        sizes = [int(x) for x in args.sizes.split(',') if x.strip()]
+        results['cache_lookup'] = benchCacheLookup(sizes, args.lookups)
+
+    report = {
+        "benchmark": "KeyMaster",
+        "format": 1,
+        "time": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+# benchmarks/TraceReplay.py
+'''Replay a recorded timeline of badge scans, auth
+results and current sense edges through
+LargeMachineController on the Test* drivers, under
+virtual time: timeouts fire when the virtual clock
+reaches them, so a week of activity replays in
+seconds.  Prints the relay, light and state timeline
+the controller produced and timing stats.
+
+    python3 -m benchmarks.TraceReplay journal
+    python3 -m benchmarks.TraceReplay trace.jsonl --config KeyMaster.ini --format json
+
+The trace is a JournalLog journal directory, or a file
+of JSON lines such as
+
+    {"time": 1789000000.0, "type": "scan", "badge": "1000"}
+    {"time": 1789000000.1, "type": "auth", "badge": "1000", "authorized": true}
+    {"time": 1789000005.0, "type": "current", "value": true}
+
+where time is epoch seconds or an ISO date/time.
+'''
+import configparser
+import collections
+import argparse
+import datetime
+import json
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REPLAY_CONFIG = """
+[Drivers]
+controller = LargeMachineController
+auth = TestAuth
+log = Log
+relay = TestRelay
+relay_interface = TestInterface
+currentsense = TestCurrentSense
+light = TestRGBLight
+light_interface = TestInterface
+"""
+
+TraceEvent = collections.namedtuple('TraceEvent', 'time type badge value')
+
+
+class VirtualClock:
+    """
+        Clock for Scheduler that only moves when told
+    """
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def parseTime(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+def readJsonTrace(path):
+    events = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            record = json.loads(line)
+            kind = record.get('type')
+            if kind not in ('scan', 'auth', 'current'):
+                raise Exception("%s:%d: unknown event type %r" % (path, number, kind))
+            if kind == 'auth':
+                value = bool(record.get('authorized'))
+            else:
+                value = bool(record.get('value'))
+            events.append(TraceEvent(parseTime(record['time']), kind,
+                                     str(record.get('badge', "")), value))
+    return events
+
+def readJournalTrace(directory):
+    from utils.Journal import JournalReader, SCAN, AUTH, CURRENT
+    names = {SCAN: 'scan', AUTH: 'auth', CURRENT: 'current'}
+    return [TraceEvent(record.time, names[record.kind], record.badge, bool(record.value))
+            for record in JournalReader(directory).records(kinds=set(names))]
+
+def readTrace(path):
+    if os.path.isdir(path):
+        events = readJournalTrace(path)
+    else:
+        events = readJsonTrace(path)
+    # stable, events recorded at the same time keep their order
+    events.sort(key=lambda x: x.time)
+    return events
+
+
+class Replay:
+    """
+        Replay
+
+        Builds the Test* stack without starting any driver
+        thread.  The controller's timeouts and, with blink,
+        the indicator engine run on a Scheduler with a
+        virtual clock, and the controller's queue is drained
+        on this thread after every trace event and timer.
+    """
+
+    def __init__(self, config=None, authorized=None, blink=False):
+        from utils.Loader import Loader
+        from utils.Scheduler import Scheduler
+        from utils.IndicatorEngine import IndicatorEngine
+
+        loader_config = configparser.ConfigParser()
+        loader_config.read_string(REPLAY_CONFIG)
+        if config != None and config.has_section('LargeMachineController'):
+            loader_config['LargeMachineController'] = dict(config.items('LargeMachineController'))
+        # scans are decided by TestAuth only when a badge list is given
+        self.decide_scans = authorized != None
+        if self.decide_scans:
+            loader_config['TestAuth'] = {'authorized': authorized}
+
+        self.loader = Loader(loader_config)
+        self.loader.loadDrivers(loader_config.items('Drivers'))
+        self.loader.setupDrivers()
+
+        self.controller = self.loader.getDriver('controller')
+        self.auth = self.loader.getDriver('auth')
+        self.currentsense = self.loader.getDriver('currentsense')
+        self.relay = self.loader.getDriver('relay')
+        self.light = self.loader.getDriver('light')
+
+        self.clock = VirtualClock()
+        self.scheduler = Scheduler(self.clock, "replay", threaded=False)
+        self.controller.scheduler = self.scheduler
+        if blink:
+            self.light.engine = IndicatorEngine(self.scheduler)
+        else:
+            # blinks are started and stopped but never stepped
+            self.light.engine = IndicatorEngine(Scheduler(self.clock, "blink", threaded=False))
+
+        self.colors = {}
+        for name in dir(self.light):
+            if name.startswith('COLOR_'):
+                self.colors[tuple(getattr(self.light, name))] = name[6:].lower()
+
+        self.timeline = []
+        self.handled = collections.Counter()
+        self.event_times = []
+        self.recordDrivers()
+
+    def recordDrivers(self):
+        # wrap the outputs so every command lands on the timeline
+        relay_on, relay_off = self.relay.on, self.relay.off
+        light_on, light_off = self.light.on, self.light.off
+
+        def relayOn():
+            self.record('relay', 'on')
+            relay_on()
+
+        def relayOff():
+            self.record('relay', 'off')
+            relay_off()
+
+        def lightOn(intensity=None, blink=False, count=None):
+            color = intensity
+            if isinstance(intensity, list):
+                color = self.colors.get(tuple(intensity), intensity)
+            detail = str(color)
+            if blink:
+                detail += " blink"
+            if count != None:
+                detail += " x%g" % count
+            self.record('light', detail)
+            light_on(intensity, blink, count)
+
+        def lightOff():
+            self.record('light', 'off')
+            light_off()
+
+        self.relay.on, self.relay.off = relayOn, relayOff
+        self.light.on, self.light.off = lightOn, lightOff
+
+    def stateName(self, state):
+        for name in dir(self.controller):
+            if name.startswith('STATE_') and getattr(self.controller, name) == state:
+                return name[6:].lower()
+        return str(state)
+
+    def eventName(self, event_type):
+        for name in dir(self.controller):
+            if name.startswith('EVENT_') and getattr(self.controller, name) == event_type:
+                return name[6:].lower()
+        return str(event_type)
+
+    def record(self, kind, detail):
+        self.timeline.append({"time": self.clock.now, "kind": kind, "detail": detail})
+
+    def drain(self):
+        queue = self.controller.queue
+        while not queue.empty():
+            event_type, message, queued = queue.get_nowait()
+            before = self.controller.state
+            if event_type == self.controller.EVENT_TIMEOUT and message != self.controller.timeout_id:
+                self.handled['stale_timeout'] += 1
+            else:
+                self.handled[self.eventName(event_type)] += 1
+            self.controller.processEvent(event_type, message, queued)
+            if self.controller.state != before:
+                self.record('state', "%s -> %s on %s" % (self.stateName(before),
+                            self.stateName(self.controller.state), self.eventName(event_type)))
+
+    def advance(self, until):
+        '''Run every timer due up to until, moving the
+        clock to each one as it fires.'''
+        while True:
+            when = self.scheduler.nextDue()
+            if when == None or when > until:
+                break
+            self.clock.now = max(self.clock.now, when)
+            self.scheduler.runDue(self.clock.now)
+            self.drain()
+        self.clock.now = max(self.clock.now, until)
+
+    def describe(self, event):
+        if event.type == 'scan':
+            return event.badge
+        if event.type == 'auth':
+            return "%s %s" % (event.badge, "authorized" if event.value else "denied")
+        return "on" if event.value else "off"
+
+    def inject(self, event):
+        if event.type == 'scan':
+            self.auth.notifyAuthProcessingObservers()
+            if self.decide_scans:
+                self.auth.lookup_rfid(event.badge)
+        elif event.type == 'auth':
+            if not self.decide_scans:
+                self.auth.notifyAuthObservers({
+                    "authorized": event.value,
+                    "id": event.badge,
+                    "user": None
+                })
+        else:
+            self.currentsense.setValue(event.value)
+
+    def run(self, events, drain_after=0.0):
+        if events:
+            self.clock.now = events[0].time
+        self.controller.connectEvents()
+        self.drain()
+
+        start = time.perf_counter()
+        for event in events:
+            self.advance(event.time)
+            self.record(event.type, self.describe(event))
+            event_start = time.perf_counter()
+            self.inject(event)
+            self.drain()
+            self.event_times.append(time.perf_counter() - event_start)
+        # let timeouts still pending at the end of the trace fire
+        self.advance(self.clock.now + drain_after)
+        wall = time.perf_counter() - start
+
+        virtual = 0.0
+        if events:
+            virtual = self.clock.now - events[0].time
+        return self.stats(len(events), virtual, wall)
+
+    def stats(self, count, virtual, wall):
+        from benchmarks.KeyMasterBench import percentiles
+        relay_closes = sum(1 for x in self.timeline if x['kind'] == 'relay' and x['detail'] == 'on')
+        return {
+            "trace_events": count,
+            "virtual_seconds": virtual,
+            "wall_seconds": wall,
+            "speedup": virtual / wall if wall > 0 else None,
+            "events_per_second": count / wall if wall > 0 else None,
+            "event_handling_seconds": percentiles(self.event_times),
+            "controller_events": dict(self.handled),
+            "relay_closes": relay_closes,
+            "final_state": self.stateName(self.controller.state),
+        }
+
+
+def formatTime(when, origin):
+    if when > 1e9:
+        stamp = datetime.datetime.fromtimestamp(when).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    else:
+        stamp = "%.3f" % when
+    return "%s  +%10.3f" % (stamp, when - origin)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a KeyMaster event trace under virtual time")
+    parser.add_argument('trace', help="JournalLog directory or JSON lines file")
+    parser.add_argument('--config', help="KeyMaster ini to take [LargeMachineController] settings from")
+    parser.add_argument('--authorized',
+                        help="comma separated badges, decide scans with these instead of recorded auth results")
+    parser.add_argument('--blink', action='store_true', help="step blinking lights on the virtual clock")
+    parser.add_argument('--drain', type=float, default=3600.0,
+                        help="virtual seconds to run past the last event")
+    parser.add_argument('--format', choices=('text', 'json'), default='text')
+    parser.add_argument('--output', help="write here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    trace = os.path.abspath(args.trace)
+    config = None
+    if args.config:
+        config = configparser.ConfigParser()
+        config.read(args.config)
+    # drivers are found relative to the repository root
+    os.chdir(ROOT)
+
+    events = readTrace(trace)
+    replay = Replay(config, args.authorized, args.blink)
+    stats = replay.run(events, args.drain)
+
+    if args.format == 'json':
+        text = json.dumps({"timeline": replay.timeline, "stats": stats}, indent=2, sort_keys=True)
+    else:
+        origin = events[0].time if events else 0.0
+        lines = ["%s  %-7s %s" % (formatTime(x['time'], origin), x['kind'], x['detail'])
+                 for x in replay.timeline]
+        lines.append(json.dumps(stats, indent=2, sort_keys=True))
+        text = "\n".join(lines)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
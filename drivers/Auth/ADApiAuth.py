@@ -1,25 +1,20 @@
 from drivers.Auth.Auth import Auth
 import requests
 from utils.Observer import Observer
-from utils.Synchronization import synchronize
-import threading
+from utils.TTLCache import TTLCache
 import logging
 
 class ADApiAuth(Auth):
-	def __init__(self, config, loader):
-		self.mutex = threading.RLock()
-		super().__init__(config, loader)
-		
+	# every lookup that misses the cache waits on the API
+	LOOKUP_WORKERS = 2
+
 	def setup(self):
 		self.rfid = self.getDriver('rfid')
 		self.log = self.getDriver('log')
 
 		logging.debug("Setup ADApiAuth")
 
-		self.groups_allowed = self.config['groups_allowed'].split(',')
-		self.groups_denied = self.config['groups_denied'].split(',')
-		logging.debug("groups_allowed: %s" % self.groups_allowed)
-		logging.debug("groups_denied: %s" % self.groups_denied)
+		self.setupApi()
 
 		self.processing = False
 		
@@ -29,19 +24,79 @@ class ADApiAuth(Auth):
 		# do not run as thread
 		return False
 
+	def setupApi(self):
+		"""
+		Read the API settings and open the connection pool
+
+		Separate from setup so other Auth drivers can use
+		request_rfid without registering for scans.
+
+		:return: None
+		"""
+		self.groups_allowed = self.config['groups_allowed'].split(',')
+		self.groups_denied = self.config['groups_denied'].split(',')
+		logging.debug("groups_allowed: %s" % self.groups_allowed)
+		logging.debug("groups_denied: %s" % self.groups_denied)
+
+		# seconds allowed to connect to and then hear back from the API
+		self.connect_timeout = 2.0
+		if 'connect_timeout' in self.config:
+			self.connect_timeout = float(self.config['connect_timeout'])
+		self.read_timeout = 3.0
+		if 'read_timeout' in self.config:
+			self.read_timeout = float(self.config['read_timeout'])
+
+		# keep-alive connection pool reused by every lookup
+		self.session = requests.Session()
+		self.session.headers.update({'content-type': "application/x-www-form-urlencoded", })
+
+		# recent lookup results, separate lifetimes for permit and deny
+		cache_size = 1024
+		if 'cache_size' in self.config:
+			cache_size = int(self.config['cache_size'])
+		self.cache_ttl = 8 * 60 * 60
+		if 'cache_ttl' in self.config:
+			self.cache_ttl = float(self.config['cache_ttl'])
+		self.negative_cache_ttl = 60
+		if 'negative_cache_ttl' in self.config:
+			self.negative_cache_ttl = float(self.config['negative_cache_ttl'])
+		self.cache = TTLCache(cache_size, self.cache_ttl)
+
 	def auth_scan(self, id_number):
 		logging.debug("RFID scan")
 		self.notifyAuthProcessingObservers()
 	
 
-	def lookup_rfid(self, id_number):
+	def lookup(self, id_number):
+		user = self.cache.get(id_number)
+		if user is None:
+			try:
+				user = self.request_rfid(id_number)
+			except requests.RequestException as e:
+				# fail closed, the next scan tries the API again
+				logging.error("ADApiAuth lookup failed: %s" % str(e))
+				user = {
+					"authorized": False,
+					"id": id_number
+				}
+			else:
+				if user is None:
+					return None
+				if user["authorized"]:
+					self.cache.put(id_number, user)
+				else:
+					self.cache.put(id_number, user, self.negative_cache_ttl)
+
+		return user
+
+	def request_rfid(self, id_number):
 		url = self.config['url']
 		payload = "rfid={:}".format(id_number)
-		headers = {'content-type': "application/x-www-form-urlencoded", }
-		response = requests.request("POST", url, data=payload, headers=headers)
+		response = self.session.post(url, data=payload,
+			timeout=(self.connect_timeout, self.read_timeout))
 		json = response.json()
 		if "result" not in json:
-			return
+			return None
 		result = json["result"]
 
 		if "user" in result and "groups" in result["user"]:
@@ -58,12 +113,9 @@ class ADApiAuth(Auth):
 		if not deny:
 			permit = any([x in usergroups for x in self.groups_allowed])
 
-		user = {
+		return {
 			"authorized": permit,
 			"id": id_number
 		}
-		self.notifyAuthObservers(user)
-
 
-synchronize(ADApiAuth, "auth_scan, lookup_rfid")
 		
\ No newline at end of file
@@ -1,22 +1,40 @@
 from drivers.Auth.Auth import Auth
 import requests
 from utils.Observer import Observer
-from utils.Synchronization import synchronize
-import threading
+from utils.Snapshot import Snapshot
+from utils.Heartbeat import heartbeat
+from utils.Metrics import timer, counter, gauge
+from types import MappingProxyType
 import os
 import time
-import datetime
 import json
 import urllib3
 import logging
-import os
+import email.utils
 
-class ADCacheAuth(Auth):
-	ad_cache = {}
+try:
+	import ijson
+except ImportError:
+	# without ijson the cache is parsed from the temp file after download
+	ijson = None
 
+# A sync that fails with one of these is logged and retried, the cache
+# already loaded keeps being served.  ValueError covers a malformed
+# body and bad dates, OSError writing or renaming the cache file.
+SYNC_ERRORS = (requests.RequestException, ValueError, OSError)
+if ijson != None:
+	SYNC_ERRORS = SYNC_ERRORS + (ijson.JSONError,)
+
+class ADCacheAuth(Auth):
 	def __init__(self, config, loader):
-		self.mutex = threading.RLock()
+		# RFID index, replaced as a whole on every cache load so
+		# scans never wait on or see a partial sync
+		self.rfid_index = Snapshot(MappingProxyType({}))
+		self.alive = None
 		super().__init__(config, loader)
+		self.sync_time = timer("cache_sync_seconds", "One ADCacheAuth sync check, download included")
+		self.sync_failures = counter("cache_sync_failures_total", "ADCacheAuth syncs that failed")
+		gauge("cache_age_seconds", "Seconds since the cache was known to match the server", self.cacheAge)
 		
 	def setup(self):
 		self.rfid = self.getDriver('rfid')
@@ -24,10 +42,10 @@ class ADCacheAuth(Auth):
 
 		logging.debug("Setup ADCacheAuth")
 
-		self.groups_allowed = self.config['groups_allowed'].split(',')
-		self.groups_denied = self.config['groups_denied'].split(',')
-		logging.debug("groups_allowed: %s" % self.groups_allowed)
-		logging.debug("groups_denied: %s" % self.groups_denied)
+		self.groups_allowed = frozenset(self.config['groups_allowed'].split(','))
+		self.groups_denied = frozenset(self.config['groups_denied'].split(','))
+		logging.debug("groups_allowed: %s" % sorted(self.groups_allowed))
+		logging.debug("groups_denied: %s" % sorted(self.groups_denied))
 
 		self.remote_cache_url = self.config['remote_cache_url']
 		self.apikey = self.config['apikey']
@@ -38,8 +56,37 @@ class ADCacheAuth(Auth):
 		if 'sync_delay' in self.config:
 			self.sync_delay = int(self.config['sync_delay'])
 
-		self.syncCheck()
-		self.loadCache()
+		# head: HEAD request then GET when the last-modified date changes
+		# conditional: single GET with If-Modified-Since/If-None-Match
+		self.sync_mode = 'head'
+		if 'sync_mode' in self.config:
+			self.sync_mode = self.config['sync_mode'].strip().lower()
+		if self.sync_mode not in ('head', 'conditional'):
+			raise Exception("ADCacheAuth has invalid sync_mode " + self.sync_mode)
+
+		# keep-alive connection reused by every sync
+		self.session = requests.Session()
+		self.session.verify = False
+		self.remote_last_modified = None
+		self.remote_etag = None
+
+		self.chunk_size = 64 * 1024
+		if 'chunk_size' in self.config:
+			self.chunk_size = int(self.config['chunk_size'])
+
+		# seconds to connect to and then hear from the cache server
+		self.sync_timeout = (5.0, 30.0)
+		if 'sync_timeout' in self.config:
+			self.sync_timeout = (5.0, float(self.config['sync_timeout']))
+
+		# Serve from the last good cache at once, the first sync runs
+		# on the driver thread once started
+		self.cache_confirmed = None
+		if os.path.exists(self.local_cache_file):
+			self.loadCache()
+			self.cache_confirmed = os.path.getmtime(self.local_cache_file)
+		else:
+			logging.error("No local AD cache, every badge is denied until the first sync")
 
 		self.processing = False
 		
@@ -53,34 +100,202 @@ class ADCacheAuth(Auth):
 		logging.debug("RFID scan")
 		self.notifyAuthProcessingObservers()
 	
-	def lookup_rfid(self, id_number):
-		permit = False
-		if id_number in self.ad_cache:
-			if "user" in self.ad_cache[id_number] and "groups" in self.ad_cache[id_number]["user"]:
-				usergroups = self.ad_cache[id_number]["user"]["groups"]
-			else:
-				usergroups = []
+	def lookup(self, id_number):
+		user = self.rfid_index.get().get(id_number)
+		if user is None:
+			# unknown badge
+			user = {
+				"authorized": False,
+				"id": id_number,
+				"user": None
+			}
+		return user
+
+	def buildIndex(self, cache):
+		"""
+		Compile the raw AD cache into an index keyed by RFID
 
-			deny = any([x in usergroups for x in self.groups_denied])
-			if not deny:
-				permit = any([x in usergroups for x in self.groups_allowed])
+		Each entry holds the finished auth result, with the permit
+		decision already made, so a scan is a single dict lookup.
 
-		user = {
+		:type cache: dict
+		:param cache: Raw AD cache as decoded from ADCache.json
+
+		:rtype: dict
+		"""
+		index = {}
+		for id_number, entry in cache.items():
+			index[id_number] = self.compileEntry(id_number, entry)
+		return index
+
+	def compileEntry(self, id_number, entry):
+		user = entry.get("user")
+		if user is not None and "groups" in user:
+			usergroups = user["groups"]
+		else:
+			usergroups = ()
+
+		# Groups denied are checked first, then groups allowed
+		permit = False
+		if self.groups_denied.isdisjoint(usergroups):
+			permit = not self.groups_allowed.isdisjoint(usergroups)
+
+		return {
 			"authorized": permit,
 			"id": id_number,
-			"user": self.ad_cache[id_number]["user"]
+			"user": user
 		}
 
-		self.notifyAuthObservers(user)
-
 	def updateCache(self, newcache):
-		self.ad_cache = newcache
+		self.publishIndex(self.buildIndex(newcache))
+
+	def degraded(self):
+		""" True while there is no cache to answer from
+
+		:rtype: bool
+		"""
+		return self.cache_confirmed == None
+
+	def cacheAge(self):
+		""" Seconds since the cache was last known to match the server
+
+		Until the first sync this is the age of the local file's
+		remote modification time, so it is never understated.
+
+		:return: float, or None in degraded mode
+		"""
+		if self.cache_confirmed == None:
+			return None
+		return max(0.0, time.time() - self.cache_confirmed)
+
+	def publishIndex(self, index):
+		self.rfid_index.publish(MappingProxyType(index))
 
 	def loadCache(self):
-		with open(self.local_cache_file) as f:
-			self.ad_cache = json.load(f)
+		if ijson != None:
+			with open(self.local_cache_file, 'rb') as f:
+				index = {}
+				for id_number, entry in ijson.kvitems(f, '', use_float=True):
+					index[id_number] = self.compileEntry(id_number, entry)
+			self.publishIndex(index)
+		else:
+			with open(self.local_cache_file) as f:
+				self.updateCache(json.load(f))
+
+	def downloadCache(self, response, last_modified):
+		"""
+		Stream a cache download to disk while building the new index
+
+		Chunks are written to a temp file and, when ijson is available,
+		fed to an incremental parser at the same time so the body is
+		never held in memory.  The file and the index are only swapped
+		in once the whole download has parsed.  The heartbeat is beaten
+		for every chunk: a large download may outlast its timeout, but
+		never stalls that long between chunks.
+
+		:type response: requests.Response
+		:param response: Response opened with stream=True
+
+		:type last_modified: float
+		:param last_modified: Remote modification time for the local file
+
+		:return: None
+		"""
+		local_source = self.local_cache_file
+		temp_source = local_source + ".tmp"
+
+		try:
+			with open(temp_source, 'wb') as f:
+				if ijson != None:
+					index = {}
+					entries = ijson.sendable_list()
+					parser = ijson.kvitems_coro(entries, '', use_float=True)
+					for chunk in response.iter_content(chunk_size=self.chunk_size):
+						self.beat()
+						f.write(chunk)
+						parser.send(chunk)
+						for id_number, entry in entries:
+							index[id_number] = self.compileEntry(id_number, entry)
+						del entries[:]
+					parser.close()
+					for id_number, entry in entries:
+						index[id_number] = self.compileEntry(id_number, entry)
+				else:
+					for chunk in response.iter_content(chunk_size=self.chunk_size):
+						self.beat()
+						f.write(chunk)
+					index = None
+				f.flush()
+				os.fsync(f.fileno())
+
+			if index == None:
+				with open(temp_source) as f:
+					index = self.buildIndex(json.load(f))
+
+			os.utime(temp_source, (last_modified, last_modified))
+			os.replace(temp_source, local_source)
+		except:
+			if os.path.exists(temp_source):
+				os.remove(temp_source)
+			raise
+
+		self.publishIndex(index)
+
+	def beat(self):
+		if self.alive != None:
+			self.alive.beat()
 
 	def syncCheck(self):
+		if self.sync_mode == 'conditional':
+			synced = self.syncCheckConditional()
+		else:
+			synced = self.syncCheckHead()
+		if synced:
+			self.cache_confirmed = time.time()
+		return synced
+
+	def syncCheckConditional(self):
+		"""
+		Sync the local cache with a single conditional GET
+
+		The validators from the last download are sent back to the
+		server, a 304 Not Modified response leaves the cache alone.
+
+		:return: True if the cache is now current
+		"""
+		logging.debug("SyncCheck conditional")
+
+		remote_source = self.remote_cache_url
+		local_source = self.local_cache_file
+
+		params = {'apikey': self.apikey}
+		headers = {}
+
+		if os.path.exists(local_source):
+			if self.remote_last_modified != None:
+				headers['If-Modified-Since'] = self.remote_last_modified
+			else:
+				headers['If-Modified-Since'] = email.utils.formatdate(
+					os.path.getmtime(local_source), usegmt=True)
+			if self.remote_etag != None:
+				headers['If-None-Match'] = self.remote_etag
+
+		with self.session.get(remote_source, allow_redirects=True, params=params, headers=headers, stream=True, timeout=self.sync_timeout) as r:
+			if r.status_code == 304:
+				return True
+			if r.status_code != 200 or "last-modified" not in r.headers:
+				logging.error("Could not get cache - bad apikey? (HTTP %d)" % r.status_code)
+				return False
+
+			logging.debug("Modified downloading")
+			remote_source_last_modified = email.utils.parsedate_to_datetime(
+				r.headers["last-modified"]).timestamp()
+			self.downloadCache(r, remote_source_last_modified)
+			self.remote_last_modified = r.headers["last-modified"]
+			self.remote_etag = r.headers.get("etag")
+			return True
+
+	def syncCheckHead(self):
 		logging.debug("SyncCheck")
 
 		remote_source = self.remote_cache_url
@@ -88,45 +303,56 @@ class ADCacheAuth(Auth):
 
 		params = {'apikey': self.apikey}
 
-		response = requests.head(remote_source, verify=False, params=params)
+		response = self.session.head(remote_source, params=params, timeout=self.sync_timeout)
 		if "last-modified" in response.headers:
-			remote_source_last_modified = response.headers["last-modified"]
-			remote_source_last_modified = time.mktime(datetime.datetime.strptime(remote_source_last_modified[:-4], "%a, %d %b %Y %H:%M:%S").timetuple())
+			# an HTTP date is GMT, the same mtime conditional mode writes
+			remote_source_last_modified = email.utils.parsedate_to_datetime(
+				response.headers["last-modified"]).timestamp()
 		else:
 			logging.error("Could not get cache - bad apikey?")
-			return
+			return False
 
 		if os.path.exists(local_source):
 			local_source_last_modified = os.path.getmtime(local_source)
 			if local_source_last_modified == remote_source_last_modified:
-				pass
 				#print("Not Modified")
-			else:
-				logging.debug("Modified downloading")
-				#urlretrieve(remote_source, local_source)
-				r = requests.get(remote_source, allow_redirects=True, verify=False, params=params)
-				open(local_source, 'wb').write(r.content)
-				self.updateCache(r.json())
-				os.utime(local_source, (remote_source_last_modified, remote_source_last_modified))
+				return True
+			logging.debug("Modified downloading")
 		else:
 			logging.debug("Downloading first")
-			#urlretrieve(remote_source, local_source)
-			r = requests.get(remote_source, allow_redirects=True, verify=False, params=params)
-			open(local_source, 'wb').write(r.content)
-			self.updateCache(r.json())
-			os.utime(local_source, (remote_source_last_modified, remote_source_last_modified))
+
+		#urlretrieve(remote_source, local_source)
+		with self.session.get(remote_source, allow_redirects=True, params=params, stream=True, timeout=self.sync_timeout) as r:
+			if r.status_code != 200:
+				logging.error("Could not get cache (HTTP %d)" % r.status_code)
+				return False
+			self.downloadCache(r, remote_source_last_modified)
+		return True
 
 
 	def run(self):
 		logging.debug("Start run")
 		try:
+			# a sync may take up to its timeouts on top of the delay,
+			# downloads also beat for every chunk
+			self.alive = heartbeat("ADCacheAuth", self.sync_delay + 2 * sum(self.sync_timeout))
 			while(True):
-				self.syncCheck()
-				time.sleep(self.sync_delay)
+				self.alive.beat()
+				start = time.perf_counter()
+				try:
+					if not self.syncCheck():
+						self.sync_failures.inc()
+				except SYNC_ERRORS as e:
+					# keep serving the cache we have, try again later
+					self.sync_failures.inc()
+					logging.error("Cache sync failed: %s" % str(e))
+				self.sync_time.observe(time.perf_counter() - start)
+				if self.degraded():
+					time.sleep(min(self.sync_delay, 5))
+				else:
+					time.sleep(self.sync_delay)
 		except Exception as e:
 			logging.error("Exception: %s" % str(e), exc_info=1)
 			os._exit(42) # Make sure entire application exits
 
-
-synchronize(ADCacheAuth, "auth_scan, lookup_rfid")
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -1,12 +1,63 @@
 from drivers.Loadable import Loadable
-from utils.Observer import Observable
+from utils.Observer import Observable, configuredDispatcher
+from utils.ScanDispatcher import ScanDispatcher
+from utils.Metrics import timer, counter
+import time
+
+LOOKUP_TIME = timer("auth_lookup_seconds", "Looking up one scanned badge")
 
 
 class Auth(Loadable):
+    # lookup_workers when not configured, drivers whose lookup waits
+    # on the network default to a pool so the reader never waits
+    LOOKUP_WORKERS = 0
+
     def __init__(self, config, loader):
         super().__init__(config, loader)
         self.authNotifier = self.AuthNotifier()
         self.authProcessingNotifier = self.AuthProcessingNotifier()
+        # one dispatcher for both, processing is seen before the result
+        dispatcher = configuredDispatcher(config, type(self).__name__)
+        self.authNotifier.setDispatcher(dispatcher)
+        self.authProcessingNotifier.setDispatcher(dispatcher)
+
+        # lookup_workers > 0 moves lookups off the RFID reader thread
+        lookup_workers = self.LOOKUP_WORKERS
+        if 'lookup_workers' in config:
+            lookup_workers = int(config['lookup_workers'])
+        self.lookupDispatcher = None
+        if lookup_workers > 0:
+            self.lookupDispatcher = ScanDispatcher(
+                lookup_workers, self.deliverLookup)
+            counter("auth_lookups_dropped_total", "Lookups superseded by a newer scan from the same reader",
+                    lambda: self.lookupDispatcher.dropped)
+
+    def lookup(self, id_number):
+        """ Look up a scanned badge
+
+        :return: User dict with at least 'authorized' and 'id',
+                 or None to report nothing for this scan
+        """
+        return None
+
+    def lookup_rfid(self, id_number):
+        if self.lookupDispatcher == None:
+            self.deliverLookup(self.timedLookup(id_number))
+        else:
+            # scans from each reader supersede only that reader's scans
+            reader = getattr(id_number, 'reader', None)
+            self.lookupDispatcher.submit(reader, self.timedLookup, id_number)
+
+    def timedLookup(self, id_number):
+        start = time.perf_counter()
+        try:
+            return self.lookup(id_number)
+        finally:
+            LOOKUP_TIME.observe(time.perf_counter() - start)
+
+    def deliverLookup(self, user):
+        if user != None:
+            self.notifyAuthObservers(user)
 
     def observeAuth(self, observer):
         self.authNotifier.addObserver(observer)
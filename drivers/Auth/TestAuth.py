@@ -1,4 +1,27 @@
 from drivers.Auth.Auth import Auth 
 
 class TestAuth(Auth):
-    pass
+    """
+    Auth from a fixed list of badges, for running without a server
+
+    'authorized' is a comma separated list of the badge ids let in,
+    every other badge is denied.  Scans come from the rfid driver
+    when one is loaded.
+    """
+
+    def setup(self):
+        self.authorized = frozenset()
+        if 'authorized' in self.config:
+            self.authorized = frozenset(x.strip() for x in self.config['authorized'].split(','))
+
+        rfid = self.loader.getDriver('rfid')
+        if rfid != None:
+            rfid.observeScan(self.lookup_rfid)
+        return False
+
+    def lookup(self, id_number):
+        return {
+            "authorized": id_number in self.authorized,
+            "id": id_number,
+            "user": None
+        }
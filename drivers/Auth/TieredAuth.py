@@ -0,0 +1,73 @@
+from drivers.Auth.ADCacheAuth import ADCacheAuth
+from drivers.Auth.ADApiAuth import ADApiAuth
+from utils.TTLCache import TTLCache
+import requests
+import logging
+
+class TieredAuth(ADCacheAuth):
+	"""
+	Answers from the synced AD cache and asks the API only for
+	badges the cache does not know.
+
+	Permits learned from the API are kept next to the cache index
+	until the next cache load replaces them, unknown and denied
+	badges are held in a bounded negative cache.
+	"""
+
+	# badges the cache does not know wait on the API
+	LOOKUP_WORKERS = 2
+
+	def __init__(self, config, loader):
+		self.learned = {}
+		super().__init__(config, loader)
+
+	def setup(self):
+		runnable = super().setup()
+
+		logging.debug("Setup TieredAuth")
+
+		# API tier, configured from this section, never sees scans itself
+		api_config = dict(self.config)
+		api_config['lookup_workers'] = '0'
+		api_config.pop('observer_dispatch', None)
+		self.api = ADApiAuth(api_config, self.loader)
+		self.api.setupApi()
+
+		negative_cache_size = 256
+		if 'negative_cache_size' in self.config:
+			negative_cache_size = int(self.config['negative_cache_size'])
+		self.negative = TTLCache(negative_cache_size, self.api.negative_cache_ttl)
+
+		return runnable
+
+	def publishIndex(self, index):
+		# a fresh cache supersedes anything learned from the API
+		self.learned = {}
+		super().publishIndex(index)
+
+	def lookup(self, id_number):
+		user = self.rfid_index.get().get(id_number)
+		if user is None:
+			user = self.learned.get(id_number)
+		if user is None:
+			user = self.negative.get(id_number)
+		if user is not None:
+			return user
+
+		try:
+			user = self.api.request_rfid(id_number)
+		except requests.RequestException as e:
+			logging.error("TieredAuth lookup failed: %s" % str(e))
+			return {
+				"authorized": False,
+				"id": id_number,
+				"user": None
+			}
+
+		if user is None:
+			return None
+		if user["authorized"]:
+			self.learned[id_number] = user
+		else:
+			self.negative.put(id_number, user)
+		return user
@@ -3,5 +3,68 @@ import queue
 
 
 class Controller(Loadable):
+    """
+    Base class for controllers driven by a transition table
+
+    TRANSITIONS lists (state, event, handler name) rows, a later row
+    replaces an earlier one for the same (state, event) so subclasses
+    can extend their parent's table.  ENTRY and EXIT map a state to the
+    name of a method run when that state is entered or left.
+    compileTransitions() binds the table once into a
+    (state, event) -> handler map, events without a row are ignored.
+    """
+    TRANSITIONS = ()
+    ENTRY = {}
+    EXIT = {}
+
     def __init__(self, config, loader):
         super().__init__(config, loader)
+        self.state = None
+        self.transitions = {}
+        self.entry_actions = {}
+        self.exit_actions = {}
+
+    def compileTransitions(self):
+        self.transitions = {}
+        for state, event_type, handler in self.TRANSITIONS:
+            self.transitions[(state, event_type)] = getattr(self, handler)
+        self.entry_actions = {state: getattr(self, action)
+                              for state, action in self.ENTRY.items()}
+        self.exit_actions = {state: getattr(self, action)
+                             for state, action in self.EXIT.items()}
+
+    def goto(self, state):
+        """ Change state, running exit and entry actions
+
+        Nothing runs when the state does not change.
+
+        :return: None
+        """
+        if state == self.state:
+            return
+        action = self.exit_actions.get(self.state)
+        if action != None:
+            action()
+        self.state = state
+        action = self.entry_actions.get(state)
+        if action != None:
+            action()
+
+    def handleEvent(self, event_type, message):
+        """ Dispatch one event to the handler for the current state
+
+        :return: True if the event had a handler
+        """
+        handler = self.transitions.get((self.state, event_type))
+        if handler == None:
+            return False
+        self.beforeEvent(event_type, message)
+        handler(message)
+        self.afterEvent(event_type, message)
+        return True
+
+    def beforeEvent(self, event_type, message):
+        pass
+
+    def afterEvent(self, event_type, message):
+        pass
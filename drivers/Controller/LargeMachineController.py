@@ -1,10 +1,16 @@
 from drivers.Controller.Controller import Controller
+from utils.Scheduler import sharedScheduler
+from utils.Heartbeat import heartbeat
+from utils.Metrics import timer, counter, gauge, scan_to_relay
 import queue
 import time
-import threading
 import logging
 import os
 
+QUEUE_WAIT = timer("controller_queue_wait_seconds", "Time events wait in the controller queue")
+EVENT_TIME = timer("controller_event_seconds", "Handling one controller event")
+EVENTS = counter("controller_events_total", "Events taken from the controller queue")
+
 class LargeMachineController(Controller):
 	STATE_IDLE = 10
 	STATE_ON = 20
@@ -17,6 +23,41 @@ class LargeMachineController(Controller):
 	EVENT_CURRENT_SENSE = 20
 	EVENT_TIMEOUT = 30
 
+	TRANSITIONS = (
+		(STATE_IDLE, EVENT_AUTH, 'idleAuth'),
+		(STATE_IDLE, EVENT_AUTH_PROCESSING, 'authProcessing'),
+		(STATE_IDLE, EVENT_CURRENT_SENSE, 'idleCurrentSense'),
+
+		(STATE_CHECKING_FOR_STARTUP_CURRENT, EVENT_CURRENT_SENSE, 'checkingCurrentSense'),
+		(STATE_CHECKING_FOR_STARTUP_CURRENT, EVENT_TIMEOUT, 'checkingTimeout'),
+		(STATE_CHECKING_FOR_STARTUP_CURRENT, EVENT_AUTH_PROCESSING, 'authProcessing'),
+		(STATE_CHECKING_FOR_STARTUP_CURRENT, EVENT_AUTH, 'checkingAuth'),
+
+		(STATE_ON, EVENT_AUTH, 'onAuth'),
+		(STATE_ON, EVENT_AUTH_PROCESSING, 'authProcessing'),
+		(STATE_ON, EVENT_CURRENT_SENSE, 'onCurrentSense'),
+
+		(STATE_AWAITING_TIMEOUT, EVENT_TIMEOUT, 'awaitingTimeoutTimeout'),
+		(STATE_AWAITING_TIMEOUT, EVENT_CURRENT_SENSE, 'awaitingTimeoutCurrentSense'),
+		(STATE_AWAITING_TIMEOUT, EVENT_AUTH_PROCESSING, 'authProcessing'),
+		(STATE_AWAITING_TIMEOUT, EVENT_AUTH, 'awaitingTimeoutAuth'),
+
+		(STATE_AWAITING_OFF, EVENT_CURRENT_SENSE, 'awaitingOffCurrentSense'),
+	)
+
+	ENTRY = {
+		STATE_IDLE: 'enterIdle',
+		STATE_CHECKING_FOR_STARTUP_CURRENT: 'enterCheckingForStartupCurrent',
+		STATE_ON: 'enterOn',
+		STATE_AWAITING_TIMEOUT: 'enterAwaitingTimeout',
+		STATE_AWAITING_OFF: 'enterAwaitingOff',
+	}
+
+	EXIT = {
+		STATE_CHECKING_FOR_STARTUP_CURRENT: 'cancel_timeout',
+		STATE_AWAITING_TIMEOUT: 'cancel_timeout',
+	}
+
 	def setup(self):
 		self.auth = self.getDriver('auth')
 		self.currentsense = self.getDriver('currentsense')
@@ -28,11 +69,19 @@ class LargeMachineController(Controller):
 		self.rise_time = 0.3
 		self.timeout_time = 5 * 60
 		self.timer = None
+		self.timeout_id = 0
+		self.scheduler = sharedScheduler()
+		self.authId = None
+		self.shown_light = None
+		self.in_event = False
+		self.chosen_light = None
+		self.event_state = None
+		self.relay_on = None
 
 		if 'rise_time' in self.config:
-			self.rise_time = self.config['rise_time']
+			self.rise_time = float(self.config['rise_time'])
 		if 'timeout_time' in self.config:
-			self.timeout_time = self.config['timeout_time']
+			self.timeout_time = float(self.config['timeout_time'])
 
 		# Defaults
 		# [Intensity/Color, Blink, Blink Count]
@@ -57,6 +106,17 @@ class LargeMachineController(Controller):
 		self.LIGHT_AUTH_PROCESSING = self.getColorFromConfig('light_auth_processing',
 															  [self.lightdriver.COLOR_YELLOW, True, None])
 
+		# Light each state shows once any transient indication is over
+		self.state_lights = {
+			self.STATE_IDLE: self.LIGHT_IDLE,
+			self.STATE_CHECKING_FOR_STARTUP_CURRENT: self.LIGHT_ENERGIZED,
+			self.STATE_ON: self.LIGHT_ENERGIZED,
+			self.STATE_AWAITING_TIMEOUT: self.LIGHT_ENERGIZED,
+			self.STATE_AWAITING_OFF: self.LIGHT_AWATING_TURN_OFF,
+		}
+
+		self.compileTransitions()
+
 		return True
 
 	def getColorFromConfig(self, key, default=None):
@@ -78,258 +138,226 @@ class LargeMachineController(Controller):
 			return default
 
 	def light(self, color):
+		# while an event is handled only the last light chosen is shown,
+		# once the handler and any entry action are done
+		if self.in_event:
+			self.chosen_light = color
+		else:
+			self.showLight(color)
+
+	def showLight(self, color):
+		# a solid light that is already showing is left alone, count
+		# blinks always restart
+		if color is self.shown_light and color[2] == None:
+			return
+		self.shown_light = color
 		self.lightdriver.on(color[0], color[1], color[2])
 
+	def relayOn(self):
+		if self.relay_on != True:
+			self.relay_on = True
+			self.relay.on()
+			scan_to_relay.stop()
+			self.log.engaged(True)
+
+	def relayOff(self, force=False):
+		# error paths force the write, the relay may be on whatever
+		# the controller last asked for
+		if force or self.relay_on != False:
+			self.relay_on = False
+			self.relay.off()
+			self.log.engaged(False)
+
 	def start_timeout(self, timeout):
-		def updatequeue():
-			self.queue.put([self.EVENT_TIMEOUT, None])
 		self.cancel_timeout()
-		self.timer = threading.Timer(timeout, updatequeue)
-		self.timer.start()
+		self.timer = self.scheduler.schedule(timeout, self.timeoutEvent, self.timeout_id)
 
 	def cancel_timeout(self):
-		if self.timer != None and self.timer.is_alive():
+		# a timeout that fired just before being cancelled carries
+		# an old id and is ignored when it reaches the queue
+		self.timeout_id += 1
+		if self.timer != None:
 			self.timer.cancel()
+			self.timer = None
+
+	def putEvent(self, event_type, message):
+		# stamped with the time queued to measure the wait
+		self.queue.put([event_type, message, time.perf_counter()])
+
+	def timeoutEvent(self, timeout_id):
+		self.putEvent(self.EVENT_TIMEOUT, timeout_id)
 
 	def authEvent(self, user):
-		self.queue.put([self.EVENT_AUTH, user])
+		self.putEvent(self.EVENT_AUTH, user)
 
 	def authProcessingEvent(self, value):
-		self.queue.put([self.EVENT_AUTH_PROCESSING, None])
+		self.putEvent(self.EVENT_AUTH_PROCESSING, None)
 
 	def currentChangeEvent(self, value):
-		self.queue.put([self.EVENT_CURRENT_SENSE, value])
+		self.putEvent(self.EVENT_CURRENT_SENSE, value)
+
+	def handleEvent(self, event_type, message):
+		if event_type == self.EVENT_TIMEOUT and message != self.timeout_id:
+			return False
+		handled = super().handleEvent(event_type, message)
+		if event_type == self.EVENT_AUTH:
+			# the scan did not switch the relay on
+			scan_to_relay.cancel()
+		return handled
+
+	def beforeEvent(self, event_type, message):
+		self.in_event = True
+		self.chosen_light = None
+		self.event_state = self.state
+
+	def afterEvent(self, event_type, message):
+		self.in_event = False
+		color = self.chosen_light
+		if color == None and self.state == self.event_state:
+			# the handler neither moved state nor chose a light, put the
+			# state light back in case a transient indication replaced it
+			color = self.state_lights[self.state]
+		if color != None:
+			self.showLight(color)
+
+	# Entry actions
+
+	def enterIdle(self):
+		self.relayOff()
+		self.light(self.LIGHT_IDLE)
+
+	def enterCheckingForStartupCurrent(self):
+		# wait to give the current time to rise if switch left on
+		self.relayOn()
+		self.light(self.LIGHT_ENERGIZED)
+		self.start_timeout(self.rise_time)
+
+	def enterOn(self):
+		self.light(self.LIGHT_ENERGIZED)
+
+	def enterAwaitingTimeout(self):
+		# start automatic logoff timeout timer
+		self.light(self.LIGHT_ENERGIZED)
+		self.start_timeout(self.timeout_time)
+
+	def enterAwaitingOff(self):
+		self.light(self.LIGHT_AWATING_TURN_OFF)
+
+	# Event handlers
+
+	def authProcessing(self, message):
+		self.light(self.LIGHT_AUTH_PROCESSING)
+
+	def idleAuth(self, user):
+		# machine not in use
+		logging.debug("User: %s" % user)
+
+		if user['authorized']:
+			self.authId = user['id']
+			if self.currentsense.getValue():
+				# error -- relay isn't supposed to be on - stuck on?
+				self.relayOff(force=True)
+				self.light(self.LIGHT_ERROR)
+			else:
+				self.goto(self.STATE_CHECKING_FOR_STARTUP_CURRENT)
+		else:
+			# not an authorized member
+			self.light(self.LIGHT_NOT_AUTHORIZED)
+
+	def idleCurrentSense(self, value):
+		# idle light is restored after the event
+		pass
+
+	def checkingCurrentSense(self, value):
+		# machine switch left on at badge-in, logout
+		self.goto(self.STATE_IDLE)
+		self.light(self.LIGHT_SWITCH_LEFT_ON)
+
+	def checkingTimeout(self, message):
+		# machine was off, everything normal
+		self.goto(self.STATE_AWAITING_TIMEOUT)
+
+	def checkingAuth(self, user):
+		if user['authorized'] and self.authId == user['id']:
+			# user immediately badged back out
+			self.goto(self.STATE_IDLE)
+		else:
+			# not a member or same member
+			self.light(self.LIGHT_NOT_AUTHORIZED)
+
+	def onAuth(self, user):
+		# machine enabled and ready for use
+		if user['authorized'] and self.authId == user['id']:
+			if self.currentsense.getValue():
+				# machine not switched off first, wait until it is
+				self.goto(self.STATE_AWAITING_OFF)
+			else:
+				# user badged out
+				self.goto(self.STATE_IDLE)
+		else:
+			# ignore nonmember or different member
+			self.light(self.LIGHT_NOT_AUTHORIZED)
+
+	def onCurrentSense(self, value):
+		if not value:
+			# machine turned off
+			self.goto(self.STATE_AWAITING_TIMEOUT)
+
+	def awaitingTimeoutTimeout(self, message):
+		# user turned machine off but did not badge out, log user out
+		self.goto(self.STATE_IDLE)
+
+	def awaitingTimeoutCurrentSense(self, value):
+		if value:
+			# user stopped for awhile, but turned machine back on
+			self.goto(self.STATE_ON)
+		else:
+			# error state
+			self.relayOff(force=True)
+			self.light(self.LIGHT_ERROR)
+
+	def awaitingTimeoutAuth(self, user):
+		# some badge badged out
+		self.goto(self.STATE_IDLE)
+
+	def awaitingOffCurrentSense(self, value):
+		# attempt to badge out while machine is on
+		# wait until machine is turned off
+		if not value:
+			self.goto(self.STATE_IDLE)
+
+	def connectEvents(self):
+		# start taking events from the other drivers, in the idle state
+		self.queue = queue.Queue()
+		gauge("controller_queue_depth", "Events waiting in the controller queue", self.queue.qsize)
+
+		self.auth.observeAuth(self.authEvent)
+		self.auth.observeAuthProcessing(self.authProcessingEvent)
+		self.currentsense.observeCurrentChange(self.currentChangeEvent)
+
+		self.goto(self.STATE_IDLE)
+
+	def processEvent(self, event_type, message, queued):
+		start = time.perf_counter()
+		QUEUE_WAIT.observe(start - queued)
+		self.handleEvent(event_type, message)
+		EVENT_TIME.observe(time.perf_counter() - start)
+		EVENTS.inc()
 
 	def run(self):
 		logging.debug("Starting LargeMachineController")
 
 		try:
-			self.queue = queue.Queue()
-
-			self.auth.observeAuth(self.authEvent)
-			self.auth.observeAuthProcessing(self.authProcessingEvent)
-			self.currentsense.observeCurrentChange(self.currentChangeEvent)
-
-			state = self.STATE_IDLE
-			self.light(self.LIGHT_IDLE)
-			authId = None
+			self.connectEvents()
 
+			alive = heartbeat("LargeMachineController")
 			while True:
-				#if state == self.STATE_IDLE:
-				#    print("State Idle")
-				#elif state == self.STATE_CHECKING_FOR_STARTUP_CURRENT:
-				#    print("State checking for startup current")
-				#elif state == self.STATE_AWAITING_TIMEOUT:
-				#    print("State Awating timeout")
-				#elif state == self.STATE_AWAITING_OFF:
-				#    print("State Awating off")
-				#elif state == self.STATE_ON:
-				#    print("State On")
-				#else:
-				#    print("State Unknown")
-					
-				
-				event_type, message = self.queue.get()
-
-				#if event_type == self.EVENT_AUTH:
-				#    print("EVENT_AUTH")
-				#elif event_type == self.EVENT_AUTH_PROCESSING:
-				#    print("EVENT_AUTH_PROCESSING")
-				#elif event_type == self.EVENT_CURRENT_SENSE:
-				#    print("EVENT_CURRENT_SENSE")
-				#elif event_type == self.EVENT_TIMEOUT:
-				#    print("EVENT_TIMEOUT")
-				#else:
-				#    print("Unknown EVENT")
-
-				#logging.debug("Event type: "+str(event_type)+", "+str(message))
-
-				if state == self.STATE_IDLE:
-					# machine not in use
-					if event_type == self.EVENT_AUTH:
-						self.light(self.LIGHT_IDLE)
-
-						logging.debug("User: %s" % message)
-						
-						if message['authorized']:
-							authId = message['id']
-							if self.currentsense.getValue():
-								# error -- relay isn't supposed to be on - stuck on?
-
-								# relay off
-								self.relay.off()
-
-								# red LED blinking
-								self.light(self.LIGHT_ERROR)
-							else:
-								# wait to give the current time to rise if switch left on
-								state = self.STATE_CHECKING_FOR_STARTUP_CURRENT
-
-								# relay on
-								self.relay.on()
-
-								# green LED on
-								self.light(self.LIGHT_ENERGIZED)
-
-								# start current rise time timer
-								self.start_timeout(self.rise_time)
-						else:
-							# not an authorized member
-							# blink red LED a few times
-							self.light(self.LIGHT_NOT_AUTHORIZED)
-
-					elif event_type == self.EVENT_AUTH_PROCESSING:
-						self.light(self.LIGHT_AUTH_PROCESSING)
-
-					elif event_type == self.EVENT_CURRENT_SENSE:
-						if not message:
-							self.light(self.LIGHT_IDLE)
-
-				elif state == self.STATE_CHECKING_FOR_STARTUP_CURRENT:
-					self.light(self.LIGHT_ENERGIZED)
-					
-					# checking for machine left turned on at badge-in
-					# give current time to rise
-					if event_type == self.EVENT_CURRENT_SENSE:
-						# machine switch left on
-						# logout
-						state = self.STATE_IDLE
-
-						# relay off
-						self.relay.off()
-
-						# blink all LEDs
-						self.light(self.LIGHT_SWITCH_LEFT_ON)
-
-					elif event_type == self.EVENT_TIMEOUT:
-						# machine was off, everything normal
-						state = self.STATE_AWAITING_TIMEOUT
-
-						# green LED on
-						self.light(self.LIGHT_ENERGIZED)
-						
-						# start automatic logoff timeout timer
-						self.start_timeout(self.timeout_time)
-
-					elif event_type == self.EVENT_AUTH_PROCESSING:
-						self.light(self.LIGHT_AUTH_PROCESSING)
-	
-					elif event_type == self.EVENT_AUTH:
-						if message['authorized'] and authId == message['id']:
-							# user immediately badged back out
-							state = self.STATE_IDLE
-
-							# relay off
-							self.relay.off()
-
-							# yellow LED on
-							self.light(self.LIGHT_IDLE)
-						else:
-							# not a member or same member
-
-							# blink red LED a few times
-							self.light(self.LIGHT_NOT_AUTHORIZED)
-
-				elif state == self.STATE_ON:
-					self.light(self.LIGHT_ENERGIZED)
-
-					# machine enabled and ready for use
-					if event_type == self.EVENT_AUTH:
-						if message['authorized'] and authId == message['id']:
-							if self.currentsense.getValue():
-								# machine not switched off first, wait until it is
-								state = self.STATE_AWAITING_OFF
-
-								# green LED blinking
-								self.light(self.LIGHT_AWATING_TURN_OFF)
-
-							else:
-								# user badged out
-								state = self.STATE_IDLE
-
-								# relay off
-								self.relay.off()
-
-								# yellow LED on
-								self.light(self.LIGHT_IDLE)
-						else:
-							# ignore nonmember or different member
-
-							# blink red LED a few times
-							self.light(self.LIGHT_NOT_AUTHORIZED)
-
-					elif event_type == self.EVENT_AUTH_PROCESSING:
-						self.light(self.LIGHT_AUTH_PROCESSING)
-	
-					elif event_type == self.EVENT_CURRENT_SENSE:
-						if not message:
-							# machine turned off
-							state = self.STATE_AWAITING_TIMEOUT
-
-							# start automatic logoff timeout timer
-							self.start_timeout(self.timeout_time)
-						else:
-							# machine turned on
-							pass
-
-				elif state == self.STATE_AWAITING_TIMEOUT:
-					self.light(self.LIGHT_ENERGIZED)
-
-					# user turned machine off but did not badge out
-					if event_type == self.EVENT_TIMEOUT:
-						# log user out
-						state = self.STATE_IDLE
-
-						# relay off
-						self.relay.off()
-
-						# yellow LED on
-						self.light(self.LIGHT_IDLE)
-
-					elif event_type == self.EVENT_CURRENT_SENSE:
-						if message:
-							# user stopped for awhile, but turned machine back on
-							state = self.STATE_ON
-
-							# timer off
-							self.cancel_timeout()
-						else:
-							# error state
-
-							# relay off
-							self.relay.off()
-
-							# red LED blinking
-							self.light(self.LIGHT_ERROR)
-
-					elif event_type == self.EVENT_AUTH_PROCESSING:
-						self.light(self.LIGHT_AUTH_PROCESSING)
-	
-					elif event_type == self.EVENT_AUTH:
-						# some badge badged out
-						state = self.STATE_IDLE
-
-						# relay off
-						self.relay.off()
-
-						self.light(self.LIGHT_IDLE)
-
-				elif state == self.STATE_AWAITING_OFF:
-					self.light(self.LIGHT_AWATING_TURN_OFF)
-
-					# attempt to badge out while machine is on
-					# wait until machine is turned off
-					if event_type == self.EVENT_CURRENT_SENSE:
-						if not message:
-							# machine turned off, log user out
-							state = self.STATE_IDLE
-
-							# relay off
-							self.relay.off()
-
-							# yellow LED on
-							self.light(self.LIGHT_IDLE)
+				alive.beat()
+				try:
+					event_type, message, queued = self.queue.get(timeout=5)
+				except queue.Empty:
+					continue
+				self.processEvent(event_type, message, queued)
 		except Exception as e:
 			logging.error("Exception: %s" % str(e), exc_info=1)
 			os._exit(42) # Make sure entire application exits
-
@@ -0,0 +1,120 @@
+from drivers.CurrentSense.CurrentSense import CurrentSense
+from utils.Heartbeat import heartbeat
+import numpy
+import time
+import logging
+import os
+
+class AnalogCurrentSense(CurrentSense):
+	"""
+	Current sense from an analog input
+
+	The input is sampled at sample_rate into a ring buffer holding
+	window seconds of samples.  Every batch samples the RMS (or mean)
+	of the window is computed with NumPy and compared against
+	on_threshold and off_threshold; the gap between them keeps a
+	reading near one threshold from toggling the result.
+	"""
+
+	def setup(self):
+		self.interface = self.getDriver('currentsense_interface')
+		self.log = self.getDriver('log')
+
+		self.position = self.config['interface_position']
+		self.on_threshold = float(self.config['on_threshold'])
+		self.off_threshold = self.on_threshold
+		if 'off_threshold' in self.config:
+			self.off_threshold = float(self.config['off_threshold'])
+		if self.off_threshold > self.on_threshold:
+			raise Exception("AnalogCurrentSense off_threshold is above on_threshold")
+
+		self.sample_rate = 200.0
+		if 'sample_rate' in self.config:
+			self.sample_rate = float(self.config['sample_rate'])
+		window = 0.5
+		if 'window' in self.config:
+			window = float(self.config['window'])
+		self.batch = max(1, int(self.sample_rate / 10))
+		if 'batch' in self.config:
+			self.batch = int(self.config['batch'])
+
+		# rms of (sample - offset), or the plain mean
+		self.measure = 'rms'
+		if 'measure' in self.config:
+			self.measure = self.config['measure'].strip().lower()
+		if self.measure not in ('rms', 'mean'):
+			raise Exception("AnalogCurrentSense has invalid measure " + self.measure)
+		self.offset = 0.0
+		if 'offset' in self.config:
+			self.offset = float(self.config['offset'])
+
+		size = max(self.batch, int(self.sample_rate * window))
+		self.samples = numpy.zeros(size)
+		self.scratch = numpy.zeros(size)
+		self.filled = 0
+		self.index = 0
+
+		self.reading = 0.0
+		self.value = False
+
+		return True
+
+	def getValue(self):
+		return self.value
+
+	def getReading(self):
+		""" Latest RMS or mean of the sample window
+
+		:rtype: float
+		"""
+		return self.reading
+
+	def compute(self):
+		samples = self.samples[:self.filled]
+		if self.measure == 'mean':
+			return float(samples.mean())
+		scratch = self.scratch[:self.filled]
+		numpy.subtract(samples, self.offset, out=scratch)
+		numpy.square(scratch, out=scratch)
+		return float(numpy.sqrt(scratch.mean()))
+
+	def update(self, reading):
+		self.reading = reading
+		if self.value:
+			if reading <= self.off_threshold:
+				self.value = False
+				self.notifyCurrentChangeObservers(False)
+		elif reading >= self.on_threshold:
+			self.value = True
+			self.notifyCurrentChangeObservers(True)
+
+	def run(self):
+		period = 1.0 / self.sample_rate
+		size = len(self.samples)
+		count = 0
+
+		try:
+			alive = heartbeat("AnalogCurrentSense")
+			next_sample = time.monotonic()
+			while(True):
+				self.samples[self.index] = self.interface.analog(self.position)
+				self.index = (self.index + 1) % size
+				if self.filled < size:
+					self.filled += 1
+
+				count += 1
+				if count >= self.batch:
+					count = 0
+					self.update(self.compute())
+					alive.beat()
+
+				next_sample += period
+				delay = next_sample - time.monotonic()
+				if delay > 0:
+					time.sleep(delay)
+				else:
+					# fell behind, keep the rate rather than catch up
+					next_sample = time.monotonic()
+		except Exception as e:
+			logging.error("Exception: %s" % str(e), exc_info=1)
+			os._exit(42) # Make sure entire application exits
@@ -1,29 +1,102 @@
 from drivers.CurrentSense.CurrentSense import CurrentSense
+from utils.Heartbeat import heartbeat
+import threading
 import time
 import logging
 import os
 
 class BinaryCurrentSense(CurrentSense):
+	"""
+	Current sense from one digital input compared against a threshold
+
+	mode = poll reads the input on a timer that speeds up to
+	min_poll after a change and backs off to max_poll while it is
+	steady.  mode = interrupt waits for input edges from the
+	interface and falls back to polling if it has none.  Either way
+	a change is only reported once the input has settled for the
+	debounce time.
+	"""
+
 	def setup(self):
 		self.interface = self.getDriver('currentsense_interface')
 		self.log = self.getDriver('log')
 		self.threshold = int(self.config['threshold'])
+
+		self.mode = 'poll'
+		if 'mode' in self.config:
+			self.mode = self.config['mode'].strip().lower()
+		if self.mode not in ('poll', 'interrupt'):
+			raise Exception("BinaryCurrentSense has invalid mode " + self.mode)
+
+		self.debounce = 0.05
+		if 'debounce' in self.config:
+			self.debounce = float(self.config['debounce'])
+		self.min_poll = 0.02
+		if 'min_poll' in self.config:
+			self.min_poll = float(self.config['min_poll'])
+		self.max_poll = 0.1
+		if 'max_poll' in self.config:
+			self.max_poll = float(self.config['max_poll'])
+		# interrupt mode rereads this often in case an edge was missed
+		self.resync_interval = 1.0
+		if 'resync_interval' in self.config:
+			self.resync_interval = float(self.config['resync_interval'])
+
+		self.edge = threading.Event()
+		self.interrupts = False
+		if self.mode == 'interrupt':
+			self.interrupts = self.interface.watchInput(
+				self.config['interface_position'], self.inputEdge)
+			if not self.interrupts:
+				logging.info("BinaryCurrentSense: no input events, polling")
+
 		return True
 
 	def getValue(self):
 		return self.interface.input(self.config['interface_position']) >= self.threshold
 
+	def inputEdge(self, position):
+		self.edge.set()
+
+	def settle(self, value):
+		""" Wait out the debounce window after a change to value
+
+		:return: The settled value
+		"""
+		if self.interrupts:
+			# wait until the input has been quiet for the window
+			while self.edge.wait(self.debounce):
+				self.edge.clear()
+			return self.getValue()
+
+		time.sleep(self.debounce)
+		if self.getValue() == value:
+			return value
+		return None
+
 	def run(self):
 		current_value = self.getValue()
+		poll = self.max_poll
 
 		try:
+			alive = heartbeat("BinaryCurrentSense")
 			while(True):
-				time.sleep(0.1)
+				alive.beat()
+				if self.interrupts:
+					edge = self.edge.wait(self.resync_interval)
+					self.edge.clear()
+				else:
+					edge = False
+					time.sleep(poll)
+					poll = min(poll * 2, self.max_poll)
+
 				new_value = self.getValue()
-				if current_value != new_value:
+				if edge or new_value != current_value:
+					new_value = self.settle(new_value)
+				if new_value != None and current_value != new_value:
 					current_value = new_value
+					poll = self.min_poll
 					self.notifyCurrentChangeObservers(new_value)
 		except Exception as e:
 			logging.error("Exception: %s" % str(e), exc_info=1)
 			os._exit(42) # Make sure entire application exits
-
@@ -1,10 +1,11 @@
 from drivers.Loadable import Loadable
-from utils.Observer import Observable
+from utils.Observer import Observable, configuredDispatcher
 
 class CurrentSense(Loadable):
     def __init__(self, config, loader):
         super().__init__(config, loader)
         self.currentChangeNotifier = self.CurrentChangeNotifier()
+        self.currentChangeNotifier.setDispatcher(configuredDispatcher(config, type(self).__name__))
         self.value = None
 
     def getValue(self):
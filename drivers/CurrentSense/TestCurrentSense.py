@@ -1,5 +1,10 @@
 from drivers.CurrentSense.CurrentSense import CurrentSense
 
 class TestCurrentSense(CurrentSense):
-    pass
-    
+    def setValue(self, value):
+        """ Report a current change as a sensor would
+
+        :return: None
+        """
+        self.value = value
+        self.notifyCurrentChangeObservers(value)
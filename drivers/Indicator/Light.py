@@ -1,46 +1,109 @@
 from drivers.Loadable import Loadable
-import time
-import logging
-import os
+from utils.IndicatorEngine import sharedIndicatorEngine
+from utils.Synchronization import synchronize
+import threading
 
 class Light(Loadable):
 	"""
 	Driver for a single light and also base class for other lights
+
+	Blinking is timed by the shared IndicatorEngine, a light has no
+	thread of its own.  Subclasses with more pins override frame()
+	to map an intensity onto their pins.
 	"""
 
+	def __init__(self, config, loader):
+		self.mutex = threading.RLock()
+		super().__init__(config, loader)
+
 	def setup(self):
 		"""
 		Setup for Light Module
 
-		:return: Returns true to enable threaded run method 
+		:return: Returns false, blinking runs on the indicator engine
 		"""
 		self.interface = self.getDriver('light_interface')
 
-		self.pin = self.config['interface_position']
-		self.blink_rate = self.config['blink_rate'] / 2 or 0.5
+		self.pins = [self.config['interface_position']]
+		self.intensity = 255
+		self.setupState()
+
+		return False
+
+	def setupState(self):
+		if 'blink_rate' in self.config:
+			self.blink_rate = float(self.config['blink_rate']) / 2
+		else:
+			self.blink_rate = 0.5
+		self.engine = sharedIndicatorEngine()
+
+		# last value written to each pin, None until first written
+		self.shown = [None] * len(self.pins)
 		self.is_on = False
 
-		self.intensity = 255
 		self.blink = False
 		self.count = None
-		self.current_count = False
+		self.current_blink = False
 		self.current_count = None
 
+		self.saved = False
 		self.saved_intensity = None
 		self.saved_blink = False
 		self.saved_count = None
+		self.saved_current_blink = False
+		self.saved_current_count = None
+
+	def frame(self, intensity):
+		"""
+		Pin values for an intensity, in the order of self.pins
+		"""
+		return [intensity]
 
-		return True
+	def writeFrame(self, values):
+		""" Write the pins whose value differs from what they show
+
+		Several changed pins go out together through output_port
+		so a color change does not step through other colors.
+
+		:return: None
+		"""
+		changed = {}
+		for i, value in enumerate(values):
+			if self.shown[i] != value:
+				changed[self.pins[i]] = value
+				self.shown[i] = value
+		if len(changed) == 1:
+			for pin, value in changed.items():
+				self.interface.output(pin, value)
+		elif changed:
+			self.interface.output_port(changed)
 
 	def saveValues(self):
 		self.saved_intensity = self.intensity
 		self.saved_blink = self.blink
 		self.saved_count = self.count
+		self.saved_current_blink = self.current_blink
+		self.saved_current_count = self.current_count
+		self.saved = True
 
 	def restoreValues(self):
 		self.intensity = self.saved_intensity
+		self.current_blink = self.saved_current_blink
+		self.current_count = self.saved_current_count
 		self.blink = self.saved_blink
 		self.count = self.saved_count
+		self.saved = False
+
+		self.show()
+
+	def show(self):
+		# light at full intensity, the engine steps blinks and counts
+		self.is_on = True
+		self.writeFrame(self.frame(self.intensity))
+		if self.current_blink or self.current_count != None:
+			self.engine.activate(self, self.blink_rate)
+		else:
+			self.engine.deactivate(self)
 
 	def on(self, intensity=None, blink=False, count=None):
 		"""
@@ -62,7 +125,7 @@ class Light(Loadable):
 			self.setValue(intensity, blink, count)
 		self.current_count = self.count
 		self.current_blink = self.blink
-		self.interface.output(self.pin, self.intensity)
+		self.show()
 
 	def off(self):
 		""" Turn off light
@@ -71,7 +134,9 @@ class Light(Loadable):
 		"""
 		self.current_blink = False
 		self.current_count = None
-		self.interface.output(self.pin, 0)
+		self.engine.deactivate(self)
+		self.is_on = False
+		self.writeFrame([0] * len(self.pins))
 
 	def setValue(self, intensity, blink=False, count=None):
 		""" Sets up light, does not turn on or off light
@@ -90,28 +155,36 @@ class Light(Loadable):
 		:rtype: None
 		 """
 		self.intensity = intensity
-		self.count = count * 2  # Number of off and on cycles
+		if count == None:
+			self.count = None
+		else:
+			self.count = int(count) * 2  # Number of off and on cycles
 		self.blink = blink
 
-	def run(self):
-		try:
-			while True:
-				if self.current_count > 0:
-					self.current_count = self.current_count - 1
-				elif self.current_count == 0:
-					if self.saved_intensity != None:
-						self.restoreValues()
-						self.saved_intensity = None
-					else:
-						self.off()
-
-				time.sleep(self.blink_rate)
-				if self.current_blink:
-					self.is_on = not self.is_on
-					if self.is_on:
-						self.interface.output(self.pin, self.intensity)
-					else:
-						self.interface.output(self.pin, 0)
-		except Exception as e:
-			logging.error("Exception: %s" % str(e), exc_info=1)
-			os._exit(42) # Make sure entire application exits
+	def blinkFrame(self):
+		""" Step the blink by one half cycle, called by the engine
+
+		:return: None
+		"""
+		if self.current_count != None:
+			if self.current_count == 0:
+				self.current_blink = False
+				self.current_count = None
+				if self.saved:
+					self.restoreValues()
+				else:
+					self.off()
+				return
+			self.current_count = self.current_count - 1
+
+		if not self.current_blink:
+			return
+
+		self.is_on = not self.is_on
+		if self.is_on:
+			self.writeFrame(self.frame(self.intensity))
+		else:
+			self.writeFrame([0] * len(self.pins))
+
+
+synchronize(Light, "on off setValue blinkFrame")
@@ -1,4 +1,4 @@
-from drivers.Buzzer.Buzzer import Buzzer
+from drivers.Indicator.Buzzer import Buzzer
 
 
 class TestBuzzer(Buzzer):
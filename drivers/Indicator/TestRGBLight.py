@@ -1,5 +1,9 @@
-from drivers.Light.Light import Light
+from drivers.Indicator.RGBLight import RGBLight
 
 
-class TestRGBLight(Light):
-    pass
+class TestRGBLight(RGBLight):
+	def setup(self):
+		self.config.setdefault('interface_position_red', '8')
+		self.config.setdefault('interface_position_green', '7')
+		self.config.setdefault('interface_position_blue', '6')
+		return super().setup()
@@ -1,11 +1,9 @@
+from drivers.Interface.Interface import Interface
 import automationhat
 from exceptions.InvalidPositionException import InvalidPositionException
 
 
-class AutomationPhat:
-
-    def __init__(self):
-        pass
+class AutomationPhatInterface(Interface):
 
     def relay(self, position, value):
         position = int(position)
@@ -17,6 +15,7 @@ class AutomationPhat:
 
         if position == 1:
             automationhat.relay.one.write(value)
+            return
 
         raise InvalidPositionException(
             "Automation Phat has no relay position " + str(position))
@@ -34,6 +33,23 @@ class AutomationPhat:
         raise InvalidPositionException(
             "Automation Phat has no input position " + str(position))
 
+    def analog(self, position):
+        """ Read an analog input
+
+        :return: Input voltage
+        """
+        position = int(position)
+
+        if position == 1:
+            return automationhat.analog.one.read()
+        elif position == 2:
+            return automationhat.analog.two.read()
+        elif position == 3:
+            return automationhat.analog.three.read()
+
+        raise InvalidPositionException(
+            "Automation Phat has no analog position " + str(position))
+
     def output(self, position, value):
         position = int(position)
 
@@ -1,4 +1,24 @@
 from drivers.Loadable import Loadable
 
 class Interface(Loadable):
-    pass
\ No newline at end of file
+    def output_port(self, values):
+        """ Set several outputs together
+
+        Interfaces that can write a whole port in one operation
+        override this so the outputs change at the same time.
+
+        :type values: dict
+        :param values: Output value by position
+
+        :return: None
+        """
+        for position, value in values.items():
+            self.output(position, value)
+
+    def watchInput(self, position, callback):
+        """ Call callback(position) whenever an input changes
+
+        :return: False, this interface has no input events and
+                 must be polled
+        """
+        return False
@@ -1,20 +1,107 @@
 from drivers.Interface.Interface import Interface
 import pifacedigitalio
 from exceptions.InvalidPositionException import InvalidPositionException
+import threading
 import atexit
+import time
 
 
-class PiFaceInterface(Interface):
-    def setup(self):
+class PiFaceBoard:
+    """
+    One physical PiFace Digital, the shadow of its output port, the
+    last read of its input port and its input interrupt listener
+
+    Every PiFaceInterface driver on the same board shares this, so a
+    write from the light's interface keeps the bits the relay's
+    interface set, and an input read by one driver serves the others.
+    """
+
+    def __init__(self, hardware_addr):
         # Turn off Interrupts
         pifacedigitalio.core.deinit()
-        self.pifacedigital = pifacedigitalio.PiFaceDigital()
-        atexit.register(self.reset_piface)
-        
-        return False
-        
-    def reset_piface(self):
+        self.pifacedigital = pifacedigitalio.PiFaceDigital(hardware_addr=hardware_addr)
+        self.mutex = threading.RLock()
+        self.output_shadow = self.pifacedigital.output_port.value
+        self.input_lock = threading.Lock()
+        self.input_value = 0
+        self.input_time = None
+        # created by the first watch
+        self.listener = None
+        atexit.register(self.reset)
+
+    def reset(self):
         self.pifacedigital.init_board()
+
+    def write_port(self, port):
+        # called with the mutex held
+        if port != self.output_shadow:
+            self.pifacedigital.output_port.value = port
+            self.output_shadow = port
+
+    def read_input(self, max_age):
+        '''The input port, read again if the last read is
+        max_age seconds old or an edge has been seen since.'''
+        with self.input_lock:
+            now = time.monotonic()
+            if self.input_time == None or now - self.input_time >= max_age:
+                self.input_value = self.pifacedigital.input_port.value
+                self.input_time = now
+            return self.input_value
+
+    def watch(self, pin, callback):
+        '''Call callback() on both edges of input pin,
+        counting from 0.'''
+        def edge(event):
+            # the next read must see the new level
+            self.input_time = None
+            callback()
+
+        with self.input_lock:
+            if self.listener == None:
+                self.listener = pifacedigitalio.InputEventListener(chip=self.pifacedigital)
+                self.listener.register(pin, pifacedigitalio.IODIR_BOTH, edge)
+                self.listener.activate()
+                atexit.register(self.listener.deactivate)
+            else:
+                self.listener.register(pin, pifacedigitalio.IODIR_BOTH, edge)
+
+
+boards = {}
+boards_lock = threading.Lock()
+
+def piFaceBoard(hardware_addr=0):
+    '''The PiFaceBoard at hardware_addr, created on first use.'''
+    with boards_lock:
+        if hardware_addr not in boards:
+            boards[hardware_addr] = PiFaceBoard(hardware_addr)
+        return boards[hardware_addr]
+
+
+class PiFaceInterface(Interface):
+    """
+    PiFace Digital with whole-port reads and writes
+
+    Outputs are written as a byte from the board's shadow copy of the
+    output port, so setting a pin is one SPI transaction and setting
+    a pin to the value it already has is none.  The shadow belongs to
+    the board, not the driver, so the relay, light and current sense
+    interfaces can all be PiFaceInterface.  Input port reads are
+    shared by every driver on the board within input_cache_time
+    seconds.
+    """
+
+    def setup(self):
+        hardware_addr = 0
+        if 'hardware_addr' in self.config:
+            hardware_addr = int(self.config['hardware_addr'])
+        self.board = piFaceBoard(hardware_addr)
+        self.pifacedigital = self.board.pifacedigital
+
+        self.input_cache_time = 0.01
+        if 'input_cache_time' in self.config:
+            self.input_cache_time = float(self.config['input_cache_time'])
+
+        return False
         
     def relay(self, position, value):
         position = int(position)
@@ -26,29 +113,63 @@ class PiFaceInterface(Interface):
         raise InvalidPositionException(
             "Pyface has no relay position " + str(position))
 
+    def input_port(self):
+        """ Read all eight inputs as a byte, bit 0 is position 1
+
+        :return: int
+        """
+        return self.board.read_input(self.input_cache_time)
+
     def input(self, position):
         position = int(position)
 
         if position >= 1 and position <= 8:
-            return self.pifacedigital.input_pins[position-1].value
+            return (self.input_port() >> (position-1)) & 1
 
         raise InvalidPositionException(
             "PiFace has no input position " + str(position))
 
-    def output(self, position, value):
+    def watchInput(self, position, callback):
+        """ Call callback(position) on both edges of an input
+
+        Uses the PiFace input interrupt through the board's
+        InputEventListener, shared by every watched input of every
+        driver on the board.
+
+        :return: True
+        """
         position = int(position)
 
-        if value:
-            value = 1
-        else:
-            value = 0
+        if position < 1 or position > 8:
+            raise InvalidPositionException(
+                "PiFace has no input position " + str(position))
 
-        if position >= 1 and position <= 8:
+        self.board.watch(position-1, lambda: callback(position))
+        return True
+
+    def output(self, position, value):
+        self.output_port({position: value})
+
+    def output_port(self, values):
+        """ Set several outputs in a single write
+
+        :type values: dict
+        :param values: Output value by position, any true value is on
+
+        :return: None
+        """
+        set_bits = 0
+        clear_bits = 0
+        for position, value in values.items():
+            position = int(position)
+            if position < 1 or position > 8:
+                raise InvalidPositionException(
+                    "PiFace has no output position " + str(position))
             if value:
-                self.pifacedigital.output_pins[position-1].turn_on()
+                set_bits |= 1 << (position-1)
             else:
-                self.pifacedigital.output_pins[position-1].turn_off()
-            return
+                clear_bits |= 1 << (position-1)
 
-        raise InvalidPositionException(
-            "PiFace has no output position " + str(position))
+        # the board's lock, other drivers write the same port
+        with self.board.mutex:
+            self.board.write_port((self.board.output_shadow & ~clear_bits) | set_bits)
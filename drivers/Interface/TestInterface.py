@@ -1,4 +1,49 @@
 from drivers.Interface.Interface import Interface
+import threading
 
 class TestInterface(Interface):
-    pass
\ No newline at end of file
+    """
+    In-memory interface for running without hardware
+
+    Outputs and relays are remembered, inputs are set with setInput(),
+    so benchmarks can drive the drivers above it and wait for what
+    they write.
+    """
+
+    def __init__(self, config, loader):
+        super().__init__(config, loader)
+        self.inputs = {}
+        self.outputs = {}
+        self.relays = {}
+        self.watchers = {}
+        self.changed = threading.Condition()
+
+    def input(self, position):
+        return self.inputs.get(position, 0)
+
+    def setInput(self, position, value):
+        self.inputs[position] = value
+        for callback in self.watchers.get(position, ()):
+            callback(position)
+
+    def watchInput(self, position, callback):
+        self.watchers.setdefault(position, []).append(callback)
+        return True
+
+    def output(self, position, value):
+        with self.changed:
+            self.outputs[position] = value
+            self.changed.notify_all()
+
+    def relay(self, position, value):
+        with self.changed:
+            self.relays[position] = value
+            self.changed.notify_all()
+
+    def waitRelay(self, position, value, timeout=None):
+        """ Wait for the relay at position to be set to value
+
+        :return: False if timeout passed first
+        """
+        with self.changed:
+            return self.changed.wait_for(lambda: self.relays.get(position) == value, timeout)
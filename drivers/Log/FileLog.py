@@ -1,7 +1,27 @@
 from drivers.Log.Log import Log
+from utils.Heartbeat import heartbeat
+from utils.Metrics import counter
 import logging
+import logging.handlers
+import threading
+import queue
+import atexit
 
 class FileLog(Log):
+    """
+    Log to a file through a bounded queue
+
+    logging calls on driver threads only format the record and put it
+    on the queue.  One writer thread appends records to the file in
+    batches with a single flush per batch, so a slow SD card never
+    delays the thread that logged.  When the queue is full records are
+    dropped and counted rather than blocking.  Records at sync_level
+    (error by default) and above are written and flushed before the
+    logging call returns, after anything still queued, because the
+    fatal paths log an error and then os._exit(), which skips atexit.
+    Set queued = false to write every record on the calling thread.
+    """
+
     def __init__(self, config, loader):
         super().__init__(config, loader)
 
@@ -24,11 +44,73 @@ class FileLog(Log):
             elif config_level == "error":
                 loglevel = logging.ERROR
 
-        if 'filename' in config:
-            logging.basicConfig(filename=config['filename'], format=format, level=loglevel, datefmt=datefmt)        
-        else:
+        if 'filename' not in config:
             raise Exception("Could not find filename configuration")
 
+        queued = True
+        if 'queued' in config:
+            queued = config['queued'].strip().lower() not in ('false', 'no', 'off', '0')
+
+        if not queued and 'rotate_bytes' not in config and 'rotate_when' not in config:
+            logging.basicConfig(filename=config['filename'], format=format, level=loglevel, datefmt=datefmt)
+            self.queue_handler = None
+            return
+
+        file_handler = self.fileHandler(config)
+        file_handler.setFormatter(logging.Formatter(format, datefmt))
+
+        root = logging.getLogger()
+        root.setLevel(loglevel)
+
+        if not queued:
+            root.addHandler(file_handler)
+            self.queue_handler = None
+            return
+
+        queue_size = 1000
+        if 'queue_size' in config:
+            queue_size = int(config['queue_size'])
+        batch_size = 100
+        if 'batch_size' in config:
+            batch_size = int(config['batch_size'])
+
+        sync_level = logging.ERROR
+        if 'sync_level' in config:
+            sync_level = logging.getLevelName(config['sync_level'].strip().upper())
+            if not isinstance(sync_level, int):
+                raise Exception("FileLog has invalid sync_level " + config['sync_level'])
+
+        self.queue_handler = DroppingQueueHandler(queue.Queue(queue_size), sync_level)
+        self.writer = QueueWriter(self.queue_handler, file_handler, batch_size)
+        self.queue_handler.writer = self.writer
+        self.writer.start()
+        root.addHandler(self.queue_handler)
+        atexit.register(self.writer.stop)
+        counter("log_records_dropped_total", "FileLog records dropped because the queue was full",
+                self.dropped)
+
+    def fileHandler(self, config):
+        backup_count = 5
+        if 'backup_count' in config:
+            backup_count = int(config['backup_count'])
+
+        if 'rotate_when' in config:
+            return BatchTimedRotatingFileHandler(config['filename'],
+                when=config['rotate_when'], backupCount=backup_count)
+        if 'rotate_bytes' in config:
+            return BatchRotatingFileHandler(config['filename'],
+                maxBytes=int(config['rotate_bytes']), backupCount=backup_count)
+        return BatchFileHandler(config['filename'])
+
+    def dropped(self):
+        """ Number of log records dropped because the queue was full
+
+        :rtype: int
+        """
+        if self.queue_handler == None:
+            return 0
+        return self.queue_handler.dropped
+
     def auth(self, user):
         logging.info("Auth: " + str(user))
 
@@ -40,8 +122,147 @@ class FileLog(Log):
 
     def info(self, message):
         logging.info(message)
-    
+
     def error(self, message):
         logging.error(message)
-    
 
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks, counting the records it drops
+
+    Records at sync_level and above go straight to the writer's file
+    on the calling thread instead.
+    """
+
+    def __init__(self, queue, sync_level=logging.ERROR):
+        super().__init__(queue)
+        self.dropped = 0
+        self.sync_level = sync_level
+        self.writer = None
+
+    def emit(self, record):
+        if record.levelno >= self.sync_level and self.writer != None:
+            try:
+                self.writer.writeNow(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+        else:
+            super().emit(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchFlush:
+    """
+    Lets the writer hold back the per-record flush of a file handler
+    """
+    batching = False
+
+    def flush(self):
+        if not self.batching:
+            super().flush()
+
+    def flushNow(self):
+        super().flush()
+
+
+class BatchFileHandler(BatchFlush, logging.FileHandler):
+    pass
+
+
+class BatchRotatingFileHandler(BatchFlush, logging.handlers.RotatingFileHandler):
+    pass
+
+
+class BatchTimedRotatingFileHandler(BatchFlush, logging.handlers.TimedRotatingFileHandler):
+    pass
+
+
+class QueueWriter(threading.Thread):
+    """
+    The single thread that writes queued records to the file
+    """
+
+    def __init__(self, queue_handler, handler, batch_size):
+        super().__init__(name="FileLog")
+        self.daemon = True
+        self.queue = queue_handler.queue
+        self.queue_handler = queue_handler
+        self.handler = handler
+        self.batch_size = batch_size
+        self.reported_drops = 0
+        self.stopping = False
+
+    def stop(self):
+        self.stopping = True
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self.join(5)
+
+    def writeNow(self, record):
+        """ Write record and everything queued before it, then flush
+
+        Runs on the logging thread, for records that must be on disk
+        before the call returns.
+        """
+        with self.handler.lock:
+            while True:
+                try:
+                    queued = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if queued == None:
+                    # stop() is waiting for the writer to see this
+                    try:
+                        self.queue.put_nowait(None)
+                    except queue.Full:
+                        pass
+                    break
+                self.handler.handle(queued)
+            self.handler.handle(record)
+            self.handler.flushNow()
+
+    def run(self):
+        alive = heartbeat("FileLog")
+        while True:
+            alive.beat()
+            try:
+                record = self.queue.get(timeout=5)
+            except queue.Empty:
+                continue
+
+            self.handler.batching = True
+            try:
+                count = 0
+                while record != None:
+                    self.handler.handle(record)
+                    count += 1
+                    if count >= self.batch_size:
+                        break
+                    try:
+                        record = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                self.reportDrops()
+            finally:
+                self.handler.batching = False
+                self.handler.flush()
+
+            if record == None and self.stopping:
+                return
+
+    def reportDrops(self):
+        dropped = self.queue_handler.dropped
+        if dropped != self.reported_drops:
+            self.handler.handle(logging.makeLogRecord({
+                'msg': "FileLog dropped %d log records, queue full" % (dropped - self.reported_drops),
+                'levelno': logging.ERROR,
+                'levelname': 'ERROR'}))
+            self.reported_drops = dropped
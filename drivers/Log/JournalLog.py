@@ -0,0 +1,118 @@
+from drivers.Log.FileLog import FileLog
+from utils.Journal import JournalWriter, SCAN, AUTH, RELAY, CURRENT
+from utils.Heartbeat import heartbeat
+from utils.Metrics import counter
+import logging
+import queue
+import time
+import os
+
+class JournalLog(FileLog):
+    """
+    FileLog that also keeps an audit journal
+
+    Scans, auth verdicts, relay changes and current transitions are
+    appended as binary records to segment files in journal_dir, see
+    utils/Journal.py for the layout and the query command.  The
+    notifying threads only queue the record, this driver's thread
+    writes them.  Relay records carry the badge last authorized, so
+    the journal can be queried for a badge's sessions.
+    """
+
+    # (driver type, observe method, event method) journaled when loaded
+    OBSERVED = (
+        ('rfid', 'observeScan', 'scanEvent'),
+        ('auth', 'observeAuth', 'authEvent'),
+        ('currentsense', 'observeCurrentChange', 'currentEvent'),
+    )
+
+    def __init__(self, config, loader):
+        super().__init__(config, loader)
+
+        self.journal_dir = "journal"
+        if 'journal_dir' in config:
+            self.journal_dir = config['journal_dir']
+        self.segment_bytes = 4 * 1024 * 1024
+        if 'segment_bytes' in config:
+            self.segment_bytes = int(config['segment_bytes'])
+        self.max_segments = 0
+        if 'max_segments' in config:
+            self.max_segments = int(config['max_segments'])
+        self.index_interval = 64 * 1024
+        if 'index_interval' in config:
+            self.index_interval = int(config['index_interval'])
+        queue_size = 1000
+        if 'journal_queue_size' in config:
+            queue_size = int(config['journal_queue_size'])
+
+        self.records = queue.Queue(queue_size)
+        self.journal_dropped = 0
+        counter("journal_records_dropped_total", "JournalLog records dropped because the queue was full",
+                lambda: self.journal_dropped)
+        self.authorized_badge = ""
+        self.session_badge = ""
+
+    def setup(self):
+        super().setup()
+        self.journal = JournalWriter(self.journal_dir, self.segment_bytes,
+                                     self.max_segments, self.index_interval)
+        return True
+
+    def record(self, kind, value=0, badge="", detail=""):
+        try:
+            self.records.put_nowait((time.time(), kind, value, badge, detail))
+        except queue.Full:
+            self.journal_dropped += 1
+
+    def scanEvent(self, rfid_number):
+        reader = getattr(rfid_number, 'reader', None)
+        self.record(SCAN, 0, str(rfid_number), reader or "")
+
+    def authEvent(self, user):
+        badge = str(user.get('id', ""))
+        if user.get('authorized'):
+            self.authorized_badge = badge
+        self.record(AUTH, 1 if user.get('authorized') else 0, badge)
+
+    def currentEvent(self, value):
+        self.record(CURRENT, 1 if value else 0)
+
+    def engaged(self, status):
+        super().engaged(status)
+        if status:
+            self.session_badge = self.authorized_badge
+        self.record(RELAY, 1 if status else 0, self.session_badge)
+
+    def run(self):
+        logging.debug("Starting JournalLog")
+
+        try:
+            for driver_type, observe, event in self.OBSERVED:
+                driver = self.loader.getDriver(driver_type)
+                if driver != None:
+                    getattr(driver, observe)(getattr(self, event))
+
+            alive = heartbeat("JournalLog")
+            reported = 0
+            while True:
+                alive.beat()
+                try:
+                    record = self.records.get(timeout=5)
+                except queue.Empty:
+                    continue
+                # write whatever has queued up, then flush once
+                while record != None:
+                    self.journal.append(*record)
+                    try:
+                        record = self.records.get_nowait()
+                    except queue.Empty:
+                        record = None
+                self.journal.flush()
+
+                if self.journal_dropped != reported:
+                    logging.error("JournalLog dropped %d records, queue full" %
+                                  (self.journal_dropped - reported))
+                    reported = self.journal_dropped
+        except Exception as e:
+            logging.error("Exception: %s" % str(e), exc_info=1)
+            os._exit(42) # Make sure entire application exits
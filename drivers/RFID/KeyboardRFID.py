@@ -1,41 +1,88 @@
 from drivers.RFID.RFID import RFID
+from utils.Heartbeat import heartbeat
+from utils.Metrics import timer
 from evdev import InputDevice, ecodes
+import selectors
 import sys
 import logging
+import time
 import os
 
+# Character for each key scancode, None for keys a reader never sends
+SCANCODES = [None] * 256
+for code, key in ((2, u'1'), (3, u'2'), (4, u'3'), (5, u'4'), (6, u'5'),
+				  (7, u'6'), (8, u'7'), (9, u'8'), (10, u'9'), (11, u'0')):
+	SCANCODES[code] = key
+KEY_ENTER = 28
+
+READ_TIME = timer("rfid_read_seconds", "Reading and decoding one batch of reader events, observers excluded")
+
 class KeyboardRFID(RFID):
+	"""
+	Keyboard emulating RFID readers
+
+	'device' names one reader, 'devices' a comma separated list.
+	All of them are served by one thread waiting on a selector, and
+	each scan is tagged with the path of the reader it came from.
+	"""
+
 	def setup(self):
 		self.log = self.getDriver('log')
+
+		self.devices = []
+		if 'device' in self.config:
+			self.devices.append(self.config['device'].strip())
+		if 'devices' in self.config:
+			self.devices.extend(x.strip() for x in self.config['devices'].split(',') if x.strip())
+		if not self.devices:
+			raise Exception("KeyboardRFID has no device configured")
+
 		return True
 
 	def run(self):
 		try:
-			scancodes = {
-				0: None, 2: u'1', 3: u'2', 4: u'3', 5: u'4', 6: u'5', 7: u'6', 8: u'7', 9: u'8', 10: u'9', 11: u'0', 28: u'\n'
-			}
-
 			# print "scan_daemon: " + str(os.getpid())
 
-			dev = InputDevice(self.config['device'])
-			dev.grab()
+			selector = selectors.DefaultSelector()
+			for path in self.devices:
+				dev = InputDevice(path)
+				dev.grab()
 
-			logging.debug(dev)
+				logging.debug(dev)
 
+				# characters of the badge being read from this reader
+				selector.register(dev, selectors.EVENT_READ, [])
 
-			rfid_code = ""
-
-			for event in dev.read_loop():
-				# If key event and key up (0)
-				if event.type == ecodes.EV_KEY and event.value == 0:
-					key = scancodes.get(event.code)
-					if key == u'\n':  # if enter
-						self.notifyScanObservers(rfid_code)
-						rfid_code = ""
-					else:
-						rfid_code = rfid_code + key
+			alive = heartbeat("KeyboardRFID")
+			while True:
+				alive.beat()
+				for key, mask in selector.select(timeout=5):
+					self.readEvents(key.fileobj, key.data)
 
 		except Exception as e:
 			logging.error("Exception: %s" % str(e), exc_info=1)
 			os._exit(42) # Make sure entire application exits
 
+	def readEvents(self, dev, rfid_code):
+		start = time.perf_counter()
+		# badges completed in this batch, notified once it is decoded
+		# so the read time does not include the observers
+		badges = []
+		try:
+			events = dev.read()
+			for event in events:
+				# If key event and key up (0)
+				if event.type == ecodes.EV_KEY and event.value == 0:
+					if event.code == KEY_ENTER:
+						badges.append(''.join(rfid_code))
+						rfid_code.clear()
+					elif event.code < len(SCANCODES):
+						key = SCANCODES[event.code]
+						if key != None:
+							rfid_code.append(key)
+		except BlockingIOError:
+			# woken without a complete event
+			pass
+		READ_TIME.observe(time.perf_counter() - start)
+		for badge in badges:
+			self.notifyScanObservers(badge, dev.path)
@@ -1,19 +1,118 @@
 from drivers.Loadable import Loadable
 from abc import ABCMeta, abstractmethod
-from utils.Observer import Observable
+from utils.Observer import Observable, configuredDispatcher
+from utils.Metrics import scan_to_relay, counter
+import time
+
+
+class Scan(str):
+    """
+    Badge number that also records the reader it came from
+
+    Compares and hashes as the plain badge number, so observers
+    that only want the number can ignore the difference.
+    """
+
+    def __new__(cls, rfid_number, reader=None):
+        scan = str.__new__(cls, rfid_number)
+        scan.reader = reader
+        return scan
 
 
 class RFID(Loadable):
+    """
+    Base class for RFID readers
+
+    Scans pass two optional filters, kept for each reader, before
+    observers see them.  dedupe_window drops the same badge read
+    again within that many seconds of its last read, so a badge held
+    to the reader counts once.  scan_rate and scan_burst limit every
+    reader to a token bucket of scans.  Both are off by default.
+    """
+
     def __init__(self, config, loader):
         super().__init__(config, loader)
         self.scanNotifier = self.ScanNotifier()
+        self.scanNotifier.setDispatcher(configuredDispatcher(config, type(self).__name__))
+
+        self.dedupe_window = 0.0
+        if 'dedupe_window' in config:
+            self.dedupe_window = float(config['dedupe_window'])
+        self.scan_rate = 0.0
+        if 'scan_rate' in config:
+            self.scan_rate = float(config['scan_rate'])
+        self.scan_burst = max(1.0, self.scan_rate)
+        if 'scan_burst' in config:
+            self.scan_burst = float(config['scan_burst'])
+
+        # by reader: [last badge, time last read]
+        self.last_scan = {}
+        # by reader: [tokens, time last refilled]
+        self.buckets = {}
+        self.scans = 0
+        self.dropped_duplicates = 0
+        self.dropped_flood = 0
+        counter("rfid_scans_total", "Scans read, dropped ones included",
+                lambda: self.scans)
+        counter("rfid_scans_dropped_duplicate_total", "Scans dropped as the same badge held to a reader",
+                lambda: self.dropped_duplicates)
+        counter("rfid_scans_dropped_flood_total", "Scans dropped by the scan_rate limit",
+                lambda: self.dropped_flood)
 
     def observeScan(self, observer):
         self.scanNotifier.addObserver(observer)
 
-    def notifyScanObservers(self, rfid_number):
+    def notifyScanObservers(self, rfid_number, reader=None):
+        self.scans += 1
+        if not self.acceptScan(rfid_number, reader):
+            return
+        if reader != None:
+            rfid_number = Scan(rfid_number, reader)
+        scan_to_relay.start()
         self.scanNotifier.notifyObservers(rfid_number)
 
+    def acceptScan(self, rfid_number, reader):
+        """ Apply the duplicate and flood filters to a scan
+
+        :return: True if observers should see the scan
+        """
+        if self.dedupe_window <= 0 and self.scan_rate <= 0:
+            return True
+        now = time.monotonic()
+
+        if self.dedupe_window > 0:
+            last = self.last_scan.get(reader)
+            if last != None and last[0] == rfid_number and \
+              now - last[1] < self.dedupe_window:
+                # still held to the reader, the window slides
+                last[1] = now
+                self.dropped_duplicates += 1
+                return False
+            self.last_scan[reader] = [rfid_number, now]
+
+        if self.scan_rate > 0:
+            bucket = self.buckets.get(reader)
+            if bucket == None:
+                bucket = [self.scan_burst, now]
+                self.buckets[reader] = bucket
+            else:
+                bucket[0] = min(self.scan_burst,
+                                bucket[0] + (now - bucket[1]) * self.scan_rate)
+                bucket[1] = now
+            if bucket[0] < 1.0:
+                self.dropped_flood += 1
+                return False
+            bucket[0] -= 1.0
+
+        return True
+
+    def scanCounters(self):
+        return {
+            "scans": self.scans,
+            "dropped_duplicates": self.dropped_duplicates,
+            "dropped_flood": self.dropped_flood,
+        }
+
     class ScanNotifier(Observable):
         def notifyObservers(self, rfid_number):
             self.setChanged()
@@ -1,6 +1,9 @@
 from drivers.Loadable import Loadable
+from utils.Metrics import timer
 import time
 
+WRITE_TIME = timer("relay_write_seconds", "Switching the relay through its interface")
+
 
 class Relay(Loadable):
     """
@@ -23,11 +26,15 @@ class Relay(Loadable):
 
         :return: None
         """
+        start = time.perf_counter()
         self.interface.relay(self.pin, 1)
+        WRITE_TIME.observe(time.perf_counter() - start)
 
     def off(self):
         """ Turn off relay
 
         :return: None
         """
+        start = time.perf_counter()
         self.interface.relay(self.pin, 0)
+        WRITE_TIME.observe(time.perf_counter() - start)
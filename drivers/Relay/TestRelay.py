@@ -1,5 +1,6 @@
 from drivers.Relay.Relay import Relay
 
 class TestRelay(Relay):
-    pass
-    
+    def setup(self):
+        self.config.setdefault('interface_position', '0')
+        return super().setup()
@@ -0,0 +1,136 @@
+# Util/Heartbeat.py
+'''Per-thread liveness: each worker thread beats a
+Heartbeat as it makes progress and a Watchdog
+reports to the outside world only while every
+heartbeat is fresh.'''
+import threading
+import socket
+import time
+import os
+import logging
+
+
+class Heartbeat:
+    """
+        Heartbeat
+
+        beat() is a single attribute store so it can be
+        called on every pass of a thread's loop.  A thread
+        that blocks waiting for work must wake up and beat
+        more often than timeout.
+    """
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+        self.last = time.monotonic()
+
+    def beat(self):
+        self.last = time.monotonic()
+
+    def stale(self, now):
+        return now - self.last > self.timeout
+
+
+heartbeats = {}
+heartbeats_lock = threading.Lock()
+
+def heartbeat(name, timeout=30):
+    '''Register (or replace) the heartbeat for name.'''
+    beat = Heartbeat(name, timeout)
+    with heartbeats_lock:
+        heartbeats[name] = beat
+    return beat
+
+def staleHeartbeats(now=None):
+    if now == None:
+        now = time.monotonic()
+    with heartbeats_lock:
+        return sorted(x.name for x in heartbeats.values() if x.stale(now))
+
+
+class Watchdog:
+    """
+        Checks the heartbeats every interval seconds and
+        tells an external watchdog the result.
+
+        notify: sd_notify datagrams on $NOTIFY_SOCKET,
+        WATCHDOG=1 only while every heartbeat is fresh.
+        file: writes the status to filename only when it
+        changes, opt in.
+        touch: the old behaviour, touches filename every
+        check while every heartbeat is fresh, so existing
+        watchers of its mtime keep working.
+        auto: notify when $NOTIFY_SOCKET is set, else touch.
+    """
+
+    def __init__(self, mode='auto', filename="KeyMaster-watchdog", interval=1.0):
+        if mode == 'auto':
+            mode = 'notify' if os.environ.get('NOTIFY_SOCKET') else 'touch'
+        if mode not in ('notify', 'file', 'touch'):
+            raise Exception("Invalid watchdog mode " + str(mode))
+        self.mode = mode
+        self.filename = filename
+        self.interval = interval
+        self.status = None
+        self.socket = None
+        self.address = None
+
+        if self.mode == 'notify':
+            address = os.environ.get('NOTIFY_SOCKET')
+            if not address:
+                raise Exception("Watchdog mode notify needs NOTIFY_SOCKET")
+            if address.startswith('@'):
+                address = '\0' + address[1:]
+            self.address = address
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def notify(self, message):
+        try:
+            self.socket.sendto(message.encode(), self.address)
+        except OSError as e:
+            logging.error("Watchdog notify failed: %s" % str(e))
+
+    def ready(self):
+        if self.mode == 'notify':
+            self.notify("READY=1")
+
+    def check(self):
+        stale = staleHeartbeats()
+        if stale:
+            status = "stuck: " + ", ".join(stale)
+        else:
+            status = "ok"
+
+        changed = status != self.status
+        if changed:
+            if stale:
+                logging.error("Watchdog: %s" % status)
+            elif self.status != None:
+                logging.info("Watchdog: threads recovered")
+            self.status = status
+
+        if self.mode == 'notify':
+            if changed:
+                self.notify("STATUS=" + status)
+            if not stale:
+                self.notify("WATCHDOG=1")
+        elif self.mode == 'file':
+            if changed:
+                self.writeStatus(status)
+        elif not stale:
+            with open(self.filename, 'a'):
+                os.utime(self.filename, None)
+        return status
+
+    def writeStatus(self, status):
+        temp = self.filename + ".tmp"
+        with open(temp, 'w') as f:
+            f.write(status + "\n")
+        os.replace(temp, self.filename)
+
+    def run(self):
+        self.ready()
+        while True:
+            self.check()
+            time.sleep(self.interval)
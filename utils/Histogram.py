@@ -0,0 +1,64 @@
+# Util/Histogram.py
+'''Fixed-bucket histogram for timings taken on hot
+paths: the buckets are allocated once and observing
+a value never allocates.'''
+from bisect import bisect_left
+
+# Upper bounds in seconds, 10us to 10s
+DEFAULT_BOUNDS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                  0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                  0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+        Histogram
+
+        counts[i] is the number of values <= bounds[i] and
+        > bounds[i-1]; the last count is for values above
+        every bound.  Updates are not locked, callers that
+        observe from several threads at once accept the odd
+        lost increment.
+    """
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def mean(self):
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+    def percentile(self, fraction):
+        '''Upper bound of the bucket holding the given
+        fraction (0.0 - 1.0) of values, or max when that
+        falls past the last bound.'''
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if i < len(self.bounds):
+                    return min(self.bounds[i], self.max)
+                return self.max
+        return self.max
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
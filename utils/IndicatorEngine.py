@@ -0,0 +1,91 @@
+# Util/IndicatorEngine.py
+'''Blink timing for every light in the process, on
+the shared Scheduler.'''
+from .Scheduler import sharedScheduler
+import threading
+
+
+class IndicatorEngine:
+    """
+    Times blinking for every light in the process
+
+    Lights register while they blink and leave when they go solid or
+    off.  A single timer on the shared scheduler is armed for the next
+    light due, so nothing wakes up while no light is blinking, and
+    lights that fall due together are stepped in the same tick.
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.mutex = threading.Lock()
+        self.due = {}
+        self.periods = {}
+        self.timer = None
+
+    def activate(self, light, period):
+        """ Start stepping light every period seconds
+
+        Restarts the phase if the light was already blinking.
+        """
+        with self.mutex:
+            self.due[light] = self.scheduler.now() + period
+            self.periods[light] = period
+            self.reschedule()
+
+    def deactivate(self, light):
+        with self.mutex:
+            if light in self.due:
+                del self.due[light]
+                del self.periods[light]
+                self.reschedule()
+
+    def blinking(self):
+        return len(self.due)
+
+    def reschedule(self):
+        # called with the mutex held
+        if not self.due:
+            if self.timer != None:
+                self.timer.cancel()
+                self.timer = None
+            return
+        first = min(self.due.values())
+        if self.timer != None:
+            if self.timer.active() and self.timer.when == first:
+                return
+            self.timer.cancel()
+        self.timer = self.scheduler.scheduleAt(first, self.tick)
+
+    def tick(self):
+        now = self.scheduler.now()
+        with self.mutex:
+            self.timer = None
+            ready = [(light, when) for light, when in self.due.items()
+                     if when <= now]
+
+        # step lights without the engine lock, they may call back
+        # into activate/deactivate
+        for light, when in ready:
+            light.blinkFrame()
+
+        with self.mutex:
+            for light, when in ready:
+                # untouched unless the light restarted or stopped
+                if self.due.get(light) == when:
+                    when += self.periods[light]
+                    if when <= now:
+                        when = now + self.periods[light]
+                    self.due[light] = when
+            self.reschedule()
+
+
+shared = None
+shared_lock = threading.Lock()
+
+def sharedIndicatorEngine():
+    '''The process wide IndicatorEngine, created on first use.'''
+    global shared
+    with shared_lock:
+        if shared == None:
+            shared = IndicatorEngine(sharedScheduler())
+        return shared
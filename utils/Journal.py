@@ -0,0 +1,305 @@
+# Util/Journal.py
+'''Append-only binary journal of machine events in
+segment files, each with a sparse index by time and
+badge so queries seek instead of scanning everything.
+
+    python3 -m utils.Journal journal sessions --badge 1234 --since 2026-09-01
+'''
+import collections
+import datetime
+import bisect
+import struct
+import os
+
+SCAN = 1
+AUTH = 2
+RELAY = 3
+CURRENT = 4
+
+KIND_NAMES = {SCAN: "scan", AUTH: "auth", RELAY: "relay", CURRENT: "current"}
+
+# record: size of the whole record, time, kind, value,
+# badge length, then the badge and detail as UTF-8
+RECORD = struct.Struct('<HdBbB')
+
+# index entry: kind, time, offset in the segment,
+# badge length, then the badge
+INDEX = struct.Struct('<BdIB')
+INDEX_TIME = 0
+INDEX_BADGE = 1
+
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+
+Record = collections.namedtuple('Record', 'time kind value badge detail')
+Session = collections.namedtuple('Session', 'badge start end')
+
+
+def encodeRecord(when, kind, value, badge, detail):
+    badge = badge.encode()[:255]
+    detail = detail.encode()
+    size = RECORD.size + len(badge) + len(detail)
+    if size > 0xffff:
+        detail = detail[:0xffff - RECORD.size - len(badge)]
+        size = 0xffff
+    return RECORD.pack(size, when, kind, value, len(badge)) + badge + detail
+
+
+class JournalWriter:
+    """
+        JournalWriter
+
+        Appends records to the newest segment and starts a
+        new one, named by its first record's time, when it
+        passes segment_bytes.  Every segment is opened fresh,
+        a segment left by a crash is never appended to, so a
+        torn record can only be the last one of a segment.
+        Not thread safe, one thread does all the writing.
+    """
+
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024,
+                 max_segments=0, index_interval=64 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.index_interval = index_interval
+        self.segment = None
+        self.index = None
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, when, kind, value=0, badge="", detail=""):
+        record = encodeRecord(when, kind, value, badge, detail)
+        if self.segment == None or self.offset >= self.segment_bytes:
+            self.openSegment(when)
+
+        if self.offset >= self.next_mark:
+            self.index.write(INDEX.pack(INDEX_TIME, when, self.offset, 0))
+            self.next_mark = self.offset + self.index_interval
+        if badge and badge not in self.badges:
+            # first record of each badge in the segment
+            self.badges.add(badge)
+            encoded = badge.encode()[:255]
+            self.index.write(INDEX.pack(INDEX_BADGE, when, self.offset, len(encoded)) + encoded)
+
+        self.segment.write(record)
+        self.offset += len(record)
+
+    def openSegment(self, when):
+        self.close()
+        name = "%013d" % int(when * 1000)
+        while os.path.exists(os.path.join(self.directory, name + SEGMENT_SUFFIX)):
+            name = "%013d" % (int(name) + 1)
+        path = os.path.join(self.directory, name)
+        self.segment = open(path + SEGMENT_SUFFIX, 'ab')
+        self.index = open(path + INDEX_SUFFIX, 'ab')
+        self.offset = 0
+        self.next_mark = 0
+        self.badges = set()
+        self.expire()
+
+    def expire(self):
+        if self.max_segments <= 0:
+            return
+        names = segmentNames(self.directory)
+        for name in names[:-self.max_segments]:
+            for suffix in (SEGMENT_SUFFIX, INDEX_SUFFIX):
+                try:
+                    os.remove(os.path.join(self.directory, name + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def flush(self):
+        if self.segment != None:
+            self.segment.flush()
+            self.index.flush()
+
+    def close(self):
+        if self.segment != None:
+            self.segment.close()
+            self.index.close()
+            self.segment = None
+            self.index = None
+
+
+def segmentNames(directory):
+    return sorted(name[:-len(SEGMENT_SUFFIX)] for name in os.listdir(directory)
+                  if name.endswith(SEGMENT_SUFFIX))
+
+
+class SegmentIndex:
+    """
+        The time marks and the first offset of each badge
+        in one segment.
+    """
+
+    def __init__(self, path):
+        self.times = []
+        self.offsets = []
+        self.badges = {}
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+
+        position = 0
+        while position + INDEX.size <= len(data):
+            kind, when, offset, length = INDEX.unpack_from(data, position)
+            position += INDEX.size
+            if position + length > len(data):
+                break
+            if kind == INDEX_TIME:
+                self.times.append(when)
+                self.offsets.append(offset)
+            else:
+                self.badges.setdefault(data[position:position + length].decode(), offset)
+            position += length
+
+    def seek(self, since=None, badge=None):
+        '''Offset to start reading from, or None when the
+        segment has no records for badge.'''
+        offset = 0
+        if since != None and self.times:
+            i = bisect.bisect_right(self.times, since) - 1
+            if i > 0:
+                offset = self.offsets[i]
+        if badge != None:
+            if badge not in self.badges:
+                return None
+            offset = max(offset, self.badges[badge])
+        return offset
+
+
+class JournalReader:
+    """
+        Queries a journal directory.  Segments entirely
+        outside the time range or without the badge are
+        skipped, the rest are read from the indexed offset.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def segments(self):
+        '''(start time, end time or None, path without
+        suffix) for every segment, oldest first.'''
+        names = segmentNames(self.directory)
+        starts = [int(name) / 1000 for name in names]
+        ends = starts[1:] + [None]
+        return [(start, end, os.path.join(self.directory, name))
+                for start, end, name in zip(starts, ends, names)]
+
+    def records(self, since=None, until=None, badge=None, kinds=None):
+        for start, end, path in self.segments():
+            if since != None and end != None and end < since:
+                continue
+            if until != None and start > until:
+                break
+            offset = SegmentIndex(path + INDEX_SUFFIX).seek(since, badge)
+            if offset == None:
+                continue
+            for record in self.readSegment(path + SEGMENT_SUFFIX, offset):
+                if until != None and record.time > until:
+                    break
+                if since != None and record.time < since:
+                    continue
+                if badge != None and record.badge != badge:
+                    continue
+                if kinds != None and record.kind not in kinds:
+                    continue
+                yield record
+
+    def readSegment(self, path, offset):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        position = 0
+        while position + RECORD.size <= len(data):
+            size, when, kind, value, length = RECORD.unpack_from(data, position)
+            if size < RECORD.size + length or position + size > len(data):
+                # torn last record
+                return
+            badge_end = position + RECORD.size + length
+            yield Record(when, kind, value,
+                         data[position + RECORD.size:badge_end].decode(errors='replace'),
+                         data[badge_end:position + size].decode(errors='replace'))
+            position += size
+
+    def lastRelay(self, before, badge=None):
+        '''The last relay record before the time before,
+        for badge if given, or None.  Segments are read
+        newest first until one has a relay record.'''
+        for start, end, path in reversed(self.segments()):
+            if start >= before:
+                continue
+            offset = SegmentIndex(path + INDEX_SUFFIX).seek(None, badge)
+            if offset == None:
+                continue
+            last = None
+            for record in self.readSegment(path + SEGMENT_SUFFIX, offset):
+                if record.time >= before:
+                    break
+                if record.kind == RELAY and (badge == None or record.badge == badge):
+                    last = record
+            if last != None:
+                return last
+        return None
+
+    def sessions(self, badge=None, since=None, until=None):
+        '''Relay on to relay off periods, by the badge
+        stamped on the relay records.  A session still
+        open has end None.  A session already open at
+        since is included with its real start.'''
+        open_sessions = {}
+        if since != None:
+            last = self.lastRelay(since, badge)
+            if last != None and last.value:
+                open_sessions[last.badge] = last.time
+        for record in self.records(since, until, badge, (RELAY,)):
+            if record.value:
+                if record.badge not in open_sessions:
+                    open_sessions[record.badge] = record.time
+            elif record.badge in open_sessions:
+                yield Session(record.badge, open_sessions.pop(record.badge), record.time)
+        for badge, start in open_sessions.items():
+            yield Session(badge, start, None)
+
+
+def parseTime(text):
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.datetime.fromisoformat(text).timestamp()
+
+def formatTime(when):
+    if when == None:
+        return "-"
+    return datetime.datetime.fromtimestamp(when).strftime('%Y-%m-%d %H:%M:%S')
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Query a KeyMaster journal")
+    parser.add_argument('directory')
+    parser.add_argument('command', choices=('records', 'sessions'))
+    parser.add_argument('--badge')
+    parser.add_argument('--since', type=parseTime, help="ISO date/time or epoch seconds")
+    parser.add_argument('--until', type=parseTime, help="ISO date/time or epoch seconds")
+    parser.add_argument('--kind', action='append', choices=sorted(KIND_NAMES.values()))
+    args = parser.parse_args(argv)
+
+    reader = JournalReader(args.directory)
+    if args.command == 'sessions':
+        for session in reader.sessions(args.badge, args.since, args.until):
+            duration = "-" if session.end == None else "%.0f" % (session.end - session.start)
+            print("%s\t%s\t%s\t%s" % (session.badge, formatTime(session.start),
+                                      formatTime(session.end), duration))
+    else:
+        kinds = None
+        if args.kind:
+            kinds = set(k for k, name in KIND_NAMES.items() if name in args.kind)
+        for record in reader.records(args.since, args.until, args.badge, kinds):
+            print("%s\t%s\t%d\t%s\t%s" % (formatTime(record.time), KIND_NAMES.get(record.kind, record.kind),
+                                          record.value, record.badge, record.detail))
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,36 @@
 from importlib import import_module
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import inspect
+import logging
+import time
+import os
+import re
+
+GET_DRIVER = re.compile(r"""getDriver\(\s*['"](\w+)['"]\s*\)""")
+
+def buildRegistry(root='drivers'):
+    """Map each driver class name to its module path,
+    from the file names under root, without importing
+    anything."""
+    registry = {}
+    for directory in sorted(os.listdir(root)):
+        path = os.path.join(root, directory)
+        if directory.startswith('__') or not os.path.isdir(path):
+            continue
+        for filename in sorted(os.listdir(path)):
+            name, ext = os.path.splitext(filename)
+            if ext == '.py' and not name.startswith('__'):
+                registry[name] = "%s.%s.%s" % (root, directory, name)
+    return registry
 
 class Loader:
-    def __init__(self, config):
+    def __init__(self, config, registry=None):
         self.drivers = {}
         self.config = config
+        self.registry = registry if registry != None else buildRegistry()
+        # by driver type: seconds spent importing and in setup()
+        self.import_times = {}
+        self.setup_times = {}
 
     def getDriver(self, driver_type):
         if driver_type in self.drivers:
@@ -13,11 +40,19 @@ class Loader:
     def getDrivers(self):
         return self.drivers.values()
 
-    def loadDriver(self, driver_type, driver):
+    def importDriver(self, driver):
+        if driver not in self.registry:
+            raise Exception("Unknown driver " + str(driver))
+        start = time.perf_counter()
+        module = import_module(self.registry[driver])
+        return module, time.perf_counter() - start
+
+    def loadDriver(self, driver_type, driver, module=None):
         #print("Attempting to load ", driver_type, ", ", driver)
-        module = import_module(driver)
+        if module == None:
+            module, self.import_times[driver_type] = self.importDriver(driver)
         driver_class = getattr(module, driver)
- 
+
         if driver_type not in self.drivers:
             self.drivers[driver_type] = None
 
@@ -34,3 +69,62 @@ class Loader:
         self.drivers[driver_type] = driver_instance
 
         return driver_instance
+
+    def loadDrivers(self, drivers, workers=4):
+        """Import the (driver type, driver) pairs in parallel,
+        then instantiate them in the order given."""
+        drivers = list(drivers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            imports = [executor.submit(self.importDriver, driver)
+                       for driver_type, driver in drivers]
+            for (driver_type, driver), future in zip(drivers, imports):
+                module, self.import_times[driver_type] = future.result()
+                self.loadDriver(driver_type, driver, module)
+
+    def dependencies(self, driver_instance):
+        """Driver types whose getDriver calls appear in the
+        source of the driver class or its base classes."""
+        found = set()
+        for klass in type(driver_instance).__mro__:
+            if klass.__module__.startswith('drivers.'):
+                try:
+                    found.update(GET_DRIVER.findall(inspect.getsource(klass)))
+                except (OSError, TypeError):
+                    pass
+        return found
+
+    def setupDrivers(self, workers=4):
+        """Run every driver's setup(), each one once the drivers
+        it asks for are set up, independent ones concurrently.
+        Returns setup()'s result by driver type."""
+        depends = {}
+        for driver_type, driver_instance in self.drivers.items():
+            depends[driver_type] = set(x for x in self.dependencies(driver_instance)
+                                       if x in self.drivers and x != driver_type)
+
+        results = {}
+        pending = list(self.drivers)
+        running = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while pending or running:
+                unfinished = set(pending) | set(running.values())
+                ready = [x for x in pending if not (depends[x] & unfinished)]
+                if not ready and not running:
+                    # dependency cycle, break it in configuration order
+                    logging.error("Driver dependency cycle among: %s" % ", ".join(pending))
+                    ready = pending[:1]
+                for driver_type in ready:
+                    pending.remove(driver_type)
+                    future = executor.submit(self.setupDriver, driver_type,
+                                             self.drivers[driver_type])
+                    running[future] = driver_type
+                done, not_done = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        return results
+
+    def setupDriver(self, driver_type, driver_instance):
+        start = time.perf_counter()
+        result = driver_instance.setup()
+        self.setup_times[driver_type] = time.perf_counter() - start
+        return result
@@ -0,0 +1,229 @@
+# Util/Metrics.py
+'''Process wide counters, gauges and histograms that
+drivers update on their hot paths, and a scrape
+endpoint serving them in Prometheus text format.'''
+import http.server
+import socketserver
+import threading
+import logging
+import time
+import os
+from .Histogram import Histogram, DEFAULT_BOUNDS
+
+PREFIX = "keymaster_"
+
+
+class Counter:
+    """
+        Counter, inc() is a single attribute update.  A
+        count its owner already keeps can instead be read
+        from function at scrape time.
+    """
+    kind = "counter"
+
+    def __init__(self, name, help, function=None):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.function = function
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        if self.function != None:
+            try:
+                self.value = self.function()
+            except Exception as e:
+                logging.error("Metric %s: %s" % (self.name, str(e)))
+        yield self.name, self.value
+
+
+class Gauge:
+    """
+        Gauge, either set() by its owner or read from
+        function at scrape time, so a queue's depth costs
+        nothing until it is scraped.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, function=None):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        if self.function != None:
+            try:
+                self.value = self.function()
+            except Exception as e:
+                logging.error("Metric %s: %s" % (self.name, str(e)))
+        yield self.name, self.value
+
+
+class Timer(Histogram):
+    """
+        Histogram of durations in seconds.  time() is
+        a context manager for code that is not on a hot
+        path, hot paths take perf_counter() themselves and
+        observe() the difference.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, bounds=DEFAULT_BOUNDS):
+        super().__init__(bounds)
+        self.name = name
+        self.help = help
+
+    def time(self):
+        return TimerContext(self)
+
+    def samples(self):
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            yield '%s_bucket{le="%s"}' % (self.name, formatValue(bound)), seen
+        yield '%s_bucket{le="+Inf"}' % self.name, self.count
+        yield self.name + "_sum", self.total
+        yield self.name + "_count", self.count
+
+
+class TimerContext:
+    def __init__(self, timer):
+        self.timer = timer
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.timer.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Stopwatch:
+    """
+        Times from one point in the code to another on a
+        different thread, such as a scan to the relay it
+        switches on.  The latest start() wins, cancel()
+        forgets it when the end is never going to come.
+    """
+
+    def __init__(self, timer):
+        self.timer = timer
+        self.started = None
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def stop(self):
+        started = self.started
+        if started != None:
+            self.started = None
+            self.timer.observe(time.perf_counter() - started)
+
+    def cancel(self):
+        self.started = None
+
+
+metrics = {}
+metrics_lock = threading.Lock()
+
+def register(metric):
+    '''Add metric to the registry, or return the one
+    already registered under its name.'''
+    with metrics_lock:
+        return metrics.setdefault(metric.name, metric)
+
+def counter(name, help="", function=None):
+    metric = register(Counter(PREFIX + name, help))
+    if function != None:
+        metric.function = function
+    return metric
+
+def gauge(name, help="", function=None):
+    metric = register(Gauge(PREFIX + name, help))
+    if function != None:
+        metric.function = function
+    return metric
+
+def timer(name, help="", bounds=DEFAULT_BOUNDS):
+    return register(Timer(PREFIX + name, help, bounds))
+
+def formatValue(value):
+    if value == None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+def render():
+    '''Every metric in Prometheus text format.'''
+    with metrics_lock:
+        registered = sorted(metrics.values(), key=lambda x: x.name)
+    lines = []
+    for metric in registered:
+        if metric.help:
+            lines.append("# HELP %s %s" % (metric.name, metric.help))
+        lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+        for name, value in metric.samples():
+            lines.append("%s %s" % (name, formatValue(value)))
+    return "\n".join(lines) + "\n"
+
+
+# Measurements shared between drivers
+scan_to_relay = Stopwatch(timer("scan_to_relay_seconds",
+                                "Badge scan to the relay it switched on"))
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SocketHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.wfile.write(render().encode())
+
+
+class MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class UnixMetricsServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serveMetrics(port=None, path=None, host="127.0.0.1"):
+    '''Serve render() over HTTP on host:port, and/or as
+    plain text to anything connecting to the Unix socket
+    path, on daemon threads.  Returns the servers.'''
+    servers = []
+    if port != None:
+        servers.append(MetricsServer((host, port), MetricsHandler))
+    if path != None:
+        if os.path.exists(path):
+            os.remove(path)
+        servers.append(UnixMetricsServer(path, SocketHandler))
+    for server in servers:
+        thread = threading.Thread(target=server.serve_forever, name="metrics")
+        thread.daemon = True
+        thread.start()
+    return servers
@@ -1,6 +1,11 @@
 # Util/Observer.py
 # Class support for "observer" pattern.
 from .Synchronization import synchronize, Synchronization
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import threading
+import queue
+import logging
 
 
 class Observer:
@@ -12,22 +17,138 @@ class Observer:
         pass
 
 
+class InlineDispatch:
+    """
+        Calls every observer on the notifying thread
+    """
+
+    def dispatch(self, observers, arg):
+        for observer in observers:
+            observer(arg)
+
+
+class ThreadDispatch:
+    """
+        Calls observers on a dedicated thread, in
+        notification order.  The notifying thread only
+        queues the notification.
+    """
+
+    def __init__(self, name=None, maxsize=0):
+        self.queue = queue.Queue(maxsize)
+        self.thread = threading.Thread(target=self.run, name=name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def dispatch(self, observers, arg):
+        self.queue.put((observers, arg))
+
+    def run(self):
+        while True:
+            observers, arg = self.queue.get()
+            for observer in observers:
+                try:
+                    observer(arg)
+                except Exception as e:
+                    logging.error("Exception: %s" % str(e), exc_info=1)
+
+
+class ExecutorDispatch:
+    """
+        Hands notifications to a shared
+        concurrent.futures executor.  Each dispatcher
+        keeps its own FIFO and has at most one
+        notification on the executor at a time, so its
+        notifications arrive in order while different
+        dispatchers share the workers.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.pending = collections.deque()
+        self.lock = threading.Lock()
+        self.draining = False
+
+    def dispatch(self, observers, arg):
+        with self.lock:
+            self.pending.append((observers, arg))
+            if self.draining:
+                return
+            self.draining = True
+        self.executor.submit(self.deliver)
+
+    def deliver(self):
+        with self.lock:
+            observers, arg = self.pending.popleft()
+        for observer in observers:
+            try:
+                observer(arg)
+            except Exception as e:
+                logging.error("Exception: %s" % str(e), exc_info=1)
+        with self.lock:
+            if not self.pending:
+                self.draining = False
+                return
+        # one notification per task, so other dispatchers get a turn
+        self.executor.submit(self.deliver)
+
+
+INLINE = InlineDispatch()
+
+shared_executor = None
+shared_executor_lock = threading.Lock()
+
+def configuredDispatcher(config, name):
+    '''The dispatcher a driver's config asks for with
+    observer_dispatch: inline (the default) calls
+    observers on the notifying thread, thread on a
+    thread of the driver's own, pool on a pool shared
+    by every driver that asks for it, in order for
+    each driver.'''
+    mode = config.get('observer_dispatch', 'inline').strip().lower()
+    if mode == 'inline':
+        return INLINE
+    if mode == 'thread':
+        return ThreadDispatch(name + "-observers")
+    if mode == 'pool':
+        global shared_executor
+        with shared_executor_lock:
+            if shared_executor == None:
+                shared_executor = ThreadPoolExecutor(max_workers=4,
+                                                     thread_name_prefix="observers")
+        return ExecutorDispatch(shared_executor)
+    raise Exception("%s has invalid observer_dispatch %s" % (name, mode))
+
+
 class Observable(Synchronization):
     """
         Observerable
+
+        The observer list is an immutable tuple that is
+        replaced, never changed, when observers are added
+        or removed, so notifying needs neither the lock
+        nor a copy of the list.
     """
 
-    def __init__(self):
-        self.obs = []
+    def __init__(self, dispatcher=None):
+        self.obs = ()
         self.changed = 0
+        self.dispatcher = dispatcher or INLINE
         Synchronization.__init__(self)
 
+    def setDispatcher(self, dispatcher):
+        '''Choose how observers are called: InlineDispatch
+        (the default), ThreadDispatch or ExecutorDispatch.'''
+        self.dispatcher = dispatcher or INLINE
+
     def addObserver(self, observer):
         if observer not in self.obs:
-            self.obs.append(observer)
+            self.obs = self.obs + (observer,)
 
     def deleteObserver(self, observer):
-        self.obs.remove(observer)
+        if observer not in self.obs:
+            raise ValueError("Observable.deleteObserver(x): x not an observer")
+        self.obs = tuple(x for x in self.obs if x != observer)
 
     def notifyObservers(self, arg=None):
         '''If 'changed' indicates that this object
@@ -36,22 +157,15 @@ class Observable(Synchronization):
         update() called with two arguments: this
         observable object and the generic 'arg'.'''
 
-        self.mutex.acquire()
-        try:
-            if not self.changed:
-                return
-            # Make a local copy in case of synchronous
-            # additions of observers:
-            localArray = self.obs[:]
-            self.clearChanged()
-        finally:
-            self.mutex.release()
-        # Updating is not required to be synchronized:
-        for observer in localArray:
-            #observer.update(self, arg)
-            observer(arg)
+        if not self.changed:
+            return
+        # The tuple is never modified, additions
+        # replace it, so this reference is stable:
+        observers = self.obs
+        self.clearChanged()
+        self.dispatcher.dispatch(observers, arg)
 
-    def deleteObservers(self): self.obs = []
+    def deleteObservers(self): self.obs = ()
 
     def setChanged(self): self.changed = 1
 
@@ -63,6 +177,4 @@ class Observable(Synchronization):
 
 
 synchronize(Observable,
-            "addObserver deleteObserver deleteObservers " +
-            "setChanged clearChanged hasChanged " +
-            "countObservers")
+            "addObserver deleteObserver deleteObservers")
@@ -0,0 +1,58 @@
+# Util/ScanDispatcher.py
+'''Runs lookups on a bounded pool of worker threads,
+delivering only the newest result for each source.'''
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+
+
+class ScanDispatcher:
+    """
+        ScanDispatcher
+
+        submit() returns immediately.  Each key (a reader) has
+        its own sequence of submissions; when a newer one
+        arrives, older ones that have not started are cancelled
+        and any older result that finishes later is dropped, so
+        results reach deliver() in scan order and a superseded
+        scan never acts after the scan that replaced it.
+    """
+
+    def __init__(self, workers, deliver):
+        self.deliver = deliver
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix="lookup")
+        self.latest = {}
+        self.pending = {}
+        self.dropped = 0
+        self.mutex = threading.Lock()
+        self.deliver_lock = threading.Lock()
+
+    def submit(self, key, function, *args):
+        with self.mutex:
+            sequence = self.latest.get(key, 0) + 1
+            self.latest[key] = sequence
+            previous = self.pending.get(key)
+            if previous is not None and previous.cancel():
+                self.dropped += 1
+            future = self.executor.submit(function, *args)
+            self.pending[key] = future
+        future.add_done_callback(
+            lambda f: self.complete(key, sequence, f))
+        return future
+
+    def complete(self, key, sequence, future):
+        if future.cancelled():
+            return
+        with self.deliver_lock:
+            if self.latest[key] != sequence:
+                # a newer scan from this key has arrived
+                self.dropped += 1
+                return
+            try:
+                self.deliver(future.result())
+            except Exception as e:
+                logging.error("Exception: %s" % str(e), exc_info=1)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
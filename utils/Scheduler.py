@@ -0,0 +1,175 @@
+# Util/Scheduler.py
+'''One thread running every timeout in the process,
+in place of a threading.Timer thread per timeout.'''
+import threading
+import itertools
+import heapq
+import time
+import logging
+from .Heartbeat import heartbeat
+
+
+class TimerHandle:
+    """
+        Returned by Scheduler.schedule, cancel() stops the
+        callback if it has not run yet.
+    """
+
+    def __init__(self, scheduler, when, callback, args):
+        self.scheduler = scheduler
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.fired = False
+
+    def cancel(self):
+        return self.scheduler.cancel(self)
+
+    def active(self):
+        return not (self.cancelled or self.fired)
+
+
+class Scheduler:
+    """
+        Scheduler
+
+        Timers are kept in a heap ordered by their due time
+        on a monotonic clock.  Cancelled timers are dropped
+        from the count at once and from the heap when they
+        reach the top, or sooner if they pile up.
+
+        With threaded=False no thread is started and the
+        owner moves time itself, typically a virtual clock
+        advanced to nextDue() followed by runDue().
+    """
+
+    # compact the heap once this many cancelled timers
+    # make up more than half of it
+    COMPACT_THRESHOLD = 64
+
+    # longest the thread sleeps before beating its heartbeat
+    HEARTBEAT_INTERVAL = 5.0
+
+    def __init__(self, clock=time.monotonic, name="scheduler", threaded=True):
+        self.clock = clock
+        self.name = name
+        self.threaded = threaded
+        self.heap = []
+        self.sequence = itertools.count()
+        self.live = 0
+        self.cancelled = 0
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def now(self):
+        return self.clock()
+
+    def schedule(self, delay, callback, *args):
+        '''Call callback(*args) on the scheduler thread
+        after delay seconds.'''
+        return self.scheduleAt(self.clock() + delay, callback, *args)
+
+    def scheduleAt(self, when, callback, *args):
+        handle = TimerHandle(self, when, callback, args)
+        with self.condition:
+            heapq.heappush(self.heap, (when, next(self.sequence), handle))
+            self.live += 1
+            if self.heap[0][2] is handle:
+                self.condition.notify()
+            self.startThread()
+        return handle
+
+    def cancel(self, handle):
+        with self.condition:
+            if not handle.active():
+                return False
+            handle.cancelled = True
+            self.live -= 1
+            self.cancelled += 1
+            if self.cancelled > self.COMPACT_THRESHOLD and \
+              self.cancelled * 2 > len(self.heap):
+                self.heap = [x for x in self.heap if not x[2].cancelled]
+                heapq.heapify(self.heap)
+                self.cancelled = 0
+            return True
+
+    def pending(self):
+        '''Number of timers waiting to fire.'''
+        return self.live
+
+    def nextDue(self):
+        '''Due time of the next timer, or None.'''
+        with self.condition:
+            while self.heap and self.heap[0][2].cancelled:
+                heapq.heappop(self.heap)
+                self.cancelled -= 1
+            if self.heap:
+                return self.heap[0][0]
+            return None
+
+    def runDue(self, now):
+        '''Fire every timer due at or before now on the
+        calling thread, in due order.'''
+        while True:
+            with self.condition:
+                handle = self.popDue(now)
+            if handle == None:
+                return
+            self.fire(handle)
+
+    def popDue(self, now):
+        '''Remove and return the next timer due at or before
+        now, or None.  Call with the condition held.'''
+        while self.heap:
+            when, sequence, handle = self.heap[0]
+            if handle.cancelled:
+                heapq.heappop(self.heap)
+                self.cancelled -= 1
+                continue
+            if when > now:
+                return None
+            heapq.heappop(self.heap)
+            handle.fired = True
+            self.live -= 1
+            return handle
+        return None
+
+    def fire(self, handle):
+        try:
+            handle.callback(*handle.args)
+        except Exception as e:
+            logging.error("Exception: %s" % str(e), exc_info=1)
+
+    def startThread(self):
+        if self.thread == None and self.threaded:
+            self.thread = threading.Thread(target=self.run, name=self.name)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        alive = heartbeat(self.name, 6 * self.HEARTBEAT_INTERVAL)
+        while True:
+            with self.condition:
+                handle = self.popDue(self.clock())
+                while handle == None:
+                    alive.beat()
+                    wait = self.HEARTBEAT_INTERVAL
+                    if self.heap:
+                        wait = min(wait, self.heap[0][0] - self.clock())
+                    self.condition.wait(wait)
+                    handle = self.popDue(self.clock())
+            alive.beat()
+            self.fire(handle)
+
+
+shared = None
+shared_lock = threading.Lock()
+
+def sharedScheduler():
+    '''The process wide Scheduler, created on first use.'''
+    global shared
+    with shared_lock:
+        if shared == None:
+            shared = Scheduler()
+        return shared
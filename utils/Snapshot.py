@@ -0,0 +1,40 @@
+# Util/Snapshot.py
+'''Read-copy-update holder for data that is read
+far more often than it is replaced.'''
+import threading
+
+
+class Snapshot:
+    """
+        Holds a reference to an immutable value.
+
+        Readers call get() without taking any lock and keep
+        using the value they got for as long as they like.
+        Writers build a complete new value off to the side and
+        publish() it, which is a single reference assignment, so
+        a reader sees either the old value or the new one and
+        never a partly built one.
+    """
+
+    def __init__(self, value=None):
+        self.value = value
+        self.generation = 0
+        self.writer = threading.Lock()
+
+    def get(self):
+        return self.value
+
+    def publish(self, value):
+        with self.writer:
+            self.value = value
+            self.generation += 1
+
+    def update(self, function):
+        '''Publish function(current value).  Writers are
+        serialized so concurrent updates are not lost; the
+        function must return a new value and leave the
+        current one untouched.'''
+        with self.writer:
+            self.value = function(self.value)
+            self.generation += 1
+            return self.value
@@ -2,10 +2,62 @@
 '''Simple emulation of Java's 'synchronized'
 keyword, from Peter Norvig.'''
 import threading
+import time
+from .Histogram import Histogram
+
+# When True every synchronized call records its lock
+# wait and hold times, see enableLockStats()
+instrumented = False
+
+# LockStats for every synchronized method, in the
+# order they were wrapped
+lock_stats = []
+
+
+class LockStats:
+    """
+        Lock timings for one synchronized method
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.wait = Histogram()
+        self.hold = Histogram()
+        self.contended = 0
+        self.holders = {}
+
+    def contention(self, holder):
+        self.contended += 1
+        self.holders[holder] = self.holders.get(holder, 0) + 1
+
+    def reset(self):
+        self.wait.reset()
+        self.hold.reset()
+        self.contended = 0
+        self.holders = {}
+
+    def report(self):
+        holders = ", ".join("%s x%d" % (name, count) for (name, count)
+                            in sorted(self.holders.items(),
+                                      key=lambda x: -x[1]))
+        return ("%s: calls=%d contended=%d "
+                "wait avg=%.6f p99=%.6f max=%.6f "
+                "hold avg=%.6f p99=%.6f max=%.6f holders=[%s]" % (
+                    self.name, self.hold.count, self.contended,
+                    self.wait.mean(), self.wait.percentile(0.99),
+                    self.wait.max,
+                    self.hold.mean(), self.hold.percentile(0.99),
+                    self.hold.max, holders))
+
 
 def synchronized(method):
+    stats = LockStats(method.__qualname__)
+    lock_stats.append(stats)
+
     def f(*args):
         self = args[0]
+        if instrumented:
+            return instrumentedCall(stats, method, args)
         self.mutex.acquire()
         # print(method.__name__, 'acquired')
         try:
@@ -13,8 +65,26 @@ def synchronized(method):
         finally:
             self.mutex.release()
             # print(method.__name__, 'released')
+    f.lock_stats = stats
     return f
 
+def instrumentedCall(stats, method, args):
+    self = args[0]
+    mutex = self.mutex
+    start = time.perf_counter()
+    if not mutex.acquire(False):
+        # last thread to acquire is the one still holding it
+        stats.contention(getattr(self, 'mutex_holder', None))
+        mutex.acquire()
+    acquired = time.perf_counter()
+    self.mutex_holder = threading.current_thread().name
+    try:
+        return method(*args)
+    finally:
+        stats.wait.observe(acquired - start)
+        stats.hold.observe(time.perf_counter() - acquired)
+        mutex.release()
+
 def synchronize(klass, names=None):
     """Synchronize methods in the given class.
     Only synchronize the methods whose names are
@@ -26,6 +96,23 @@ def synchronize(klass, names=None):
             # print("synchronizing", name)
             setattr(klass, name, synchronized(val))
 
+def enableLockStats(enabled=True):
+    """Turn lock instrumentation on or off for every
+    synchronized method.  Off costs one global read per
+    call."""
+    global instrumented
+    instrumented = enabled
+
+def dumpLockStats(all=False):
+    """Lines describing each synchronized method that
+    has been called, or every method if all=True."""
+    return [stats.report() for stats in lock_stats
+            if all or stats.hold.count]
+
+def resetLockStats():
+    for stats in lock_stats:
+        stats.reset()
+
 # You can create your own self.mutex, or inherit
 # from this class:
 class Synchronization:
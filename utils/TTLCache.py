@@ -0,0 +1,58 @@
+# Util/TTLCache.py
+'''Bounded mapping whose entries expire after a
+time to live, evicting the least recently used
+entry when it is full.'''
+from collections import OrderedDict
+from .Synchronization import synchronize, Synchronization
+import time
+
+
+class TTLCache(Synchronization):
+    """
+        TTLCache
+    """
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        Synchronization.__init__(self)
+
+    def get(self, key, default=None):
+        '''Return the live value for key, or default if it
+        is missing or has expired.'''
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > self.clock():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value, ttl=None):
+        '''Store value for key, expiring after ttl seconds
+        or the cache default.'''
+        if ttl is None:
+            ttl = self.ttl
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        self.entries[key] = (self.clock() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self): return len(self.entries)
+
+
+synchronize(TTLCache, "get put discard clear")